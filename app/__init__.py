@@ -1,3 +1,4 @@
+import queue
 import threading
 import time
 from datetime import datetime, timedelta
@@ -10,6 +11,9 @@ from flask_caching import Cache
 db = SQLAlchemy()
 cache = Cache()
 
+# Pending admin_access_logs rows (dicts), written in batches by a background thread
+access_log_queue = queue.Queue()
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
@@ -68,9 +72,28 @@ def create_app():
         # Performance indexes (idempotent CREATE INDEX IF NOT EXISTS for PostgreSQL)
         try:
             from sqlalchemy import text as _text
-            db.session.execute(_text("CREATE INDEX IF NOT EXISTS ix_consumptions_created_user ON consumptions (created_at, user_id)"))
-            db.session.execute(_text("CREATE INDEX IF NOT EXISTS ix_consumptions_user_created ON consumptions (user_id, created_at)"))
+            # Covering index for per-user month ranges grouped by beverage (entries page, month
+            # clears). It replaces the plain (user_id, created_at) index, which is its prefix.
+            # PostgreSQL carries the summed columns as INCLUDE payload; SQLite has no INCLUDE,
+            # so they become trailing key columns there.
+            covering = db.engine.dialect.name == 'postgresql'
+            if covering:
+                db.session.execute(_text("CREATE INDEX IF NOT EXISTS ix_consumptions_user_created_bev ON consumptions (user_id, created_at, beverage_id) INCLUDE (quantity, unit_price_cents)"))
+                db.session.execute(_text("CREATE INDEX IF NOT EXISTS ix_beverage_prices_role_bev_price ON beverage_prices (role_id, beverage_id) INCLUDE (price_cents)"))
+            else:
+                db.session.execute(_text("CREATE INDEX IF NOT EXISTS ix_consumptions_user_created_bev ON consumptions (user_id, created_at, beverage_id, quantity, unit_price_cents)"))
+                db.session.execute(_text("CREATE INDEX IF NOT EXISTS ix_beverage_prices_role_bev_price ON beverage_prices (role_id, beverage_id, price_cents)"))
+            db.session.execute(_text("DROP INDEX IF EXISTS ix_consumptions_user_created"))
             db.session.execute(_text("CREATE INDEX IF NOT EXISTS ix_invoices_user_period ON invoices (user_id, period)"))
+            db.session.execute(_text("CREATE INDEX IF NOT EXISTS ix_admin_access_logs_created_at ON admin_access_logs (created_at DESC)"))
+            db.session.execute(_text("CREATE INDEX IF NOT EXISTS ix_cashbook_company_date_id ON cashbook_entries (company, entry_date DESC, id DESC)"))
+            # Partial indexes spell TRUE the way each dialect renders "column == True",
+            # so the planner can match them against the ORM's filters
+            sql_true = "1" if db.engine.dialect.name == 'sqlite' else "true"
+            # Price list: "is_active ORDER BY display_order, name"
+            db.session.execute(_text(f"CREATE INDEX IF NOT EXISTS ix_display_items_active_order ON display_items (display_order, name) WHERE is_active = {sql_true}"))
+            # User-port main page only lists active users
+            db.session.execute(_text(f"CREATE INDEX IF NOT EXISTS ix_users_active_id ON users (id) WHERE status = {sql_true}"))
             db.session.commit()
             print("INFO: Ensured performance indexes exist")
         except Exception as e:
@@ -155,6 +178,169 @@ def create_app():
                 print(f"WARNING: Could not ensure category column: {e}")
                 db.session.rollback()
 
+        # Ensure the generated consumptions.total_cost_cents column exists on older schemas
+        if bind is not None:
+            try:
+                from sqlalchemy import text
+                dialect = bind.dialect.name
+                if dialect == 'postgresql':
+                    db.session.execute(text(
+                        "ALTER TABLE consumptions ADD COLUMN IF NOT EXISTS total_cost_cents INTEGER "
+                        "GENERATED ALWAYS AS (quantity * unit_price_cents) STORED"
+                    ))
+                    db.session.commit()
+                elif dialect == 'sqlite':
+                    # table_xinfo (unlike table_info) lists generated columns
+                    result = db.session.execute(text("PRAGMA table_xinfo(consumptions)"))
+                    if 'total_cost_cents' not in [row[1] for row in result.fetchall()]:
+                        # SQLite can only add VIRTUAL generated columns to an existing table
+                        db.session.execute(text(
+                            "ALTER TABLE consumptions ADD COLUMN total_cost_cents INTEGER "
+                            "GENERATED ALWAYS AS (quantity * unit_price_cents) VIRTUAL"
+                        ))
+                        db.session.commit()
+            except Exception as e:
+                print(f"WARNING: Could not ensure total_cost_cents column: {e}")
+                db.session.rollback()
+
+        # Covering index for period scans (monthly report, fingerprints): it replaces the plain
+        # (created_at, user_id) index so date ranges are answered without heap fetches.
+        # Created after the total_cost_cents migration, which PostgreSQL INCLUDEs.
+        if bind is not None:
+            try:
+                from sqlalchemy import text
+                if bind.dialect.name == 'postgresql':
+                    created = db.session.execute(text("SELECT to_regclass('ix_consumptions_created_cover')")).scalar() is None
+                    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_consumptions_created_cover ON consumptions (created_at) INCLUDE (user_id, beverage_id, quantity, unit_price_cents, total_cost_cents)"))
+                else:
+                    created = db.session.execute(text(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ix_consumptions_created_cover'"
+                    )).first() is None
+                    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_consumptions_created_cover ON consumptions (created_at, user_id, beverage_id, quantity, unit_price_cents)"))
+                db.session.execute(text("DROP INDEX IF EXISTS ix_consumptions_created_user"))
+                if created:
+                    # Refresh planner statistics once so the new index is picked up straight away
+                    db.session.execute(text("ANALYZE consumptions"))
+                db.session.commit()
+            except Exception as e:
+                print(f"WARNING: Could not create consumptions period index: {e}")
+                db.session.rollback()
+
+        # Upgrade older PostgreSQL schemas to ON DELETE CASCADE for user and role children.
+        # SQLite does not enforce foreign keys here, so the routes delete children explicitly there.
+        if bind is not None and bind.dialect.name == 'postgresql':
+            try:
+                from sqlalchemy import text
+                db.session.execute(text("""
+                    DO $$
+                    DECLARE
+                        fk RECORD;
+                    BEGIN
+                        FOR fk IN
+                            SELECT c.conname, c.conrelid::regclass AS tbl, a.attname AS col, c.confrelid::regclass AS ref
+                            FROM pg_constraint c
+                            JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+                            WHERE c.contype = 'f' AND c.confdeltype <> 'c'
+                              AND (c.conrelid::regclass, a.attname) IN (
+                                  ('consumptions'::regclass, 'user_id'),
+                                  ('invoices'::regclass, 'user_id'),
+                                  ('beverage_prices'::regclass, 'role_id')
+                              )
+                        LOOP
+                            EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', fk.tbl, fk.conname);
+                            EXECUTE format('ALTER TABLE %s ADD CONSTRAINT %I FOREIGN KEY (%I) REFERENCES %s (id) ON DELETE CASCADE',
+                                           fk.tbl, fk.conname, fk.col, fk.ref);
+                        END LOOP;
+                    END$$;
+                """))
+                db.session.commit()
+            except Exception as e:
+                print(f"WARNING: Could not ensure ON DELETE CASCADE foreign keys: {e}")
+                db.session.rollback()
+
+        # Keep user_month_consumption in sync with consumptions via triggers. The table is
+        # backfilled only in the transaction that creates the triggers, so rows written
+        # before they existed are counted once and later boots skip the full scan.
+        if bind is not None:
+            try:
+                from sqlalchemy import text
+                dialect = bind.dialect.name
+                backfill = False
+                if dialect == 'postgresql':
+                    # Serialize workers booting together; released at commit/rollback
+                    db.session.execute(text("SELECT pg_advisory_xact_lock(hashtext('user_month_consumption_setup'))"))
+                    month_of = "date_trunc('month', {row}.created_at)::date"
+                    db.session.execute(text(f"""
+                        CREATE OR REPLACE FUNCTION user_month_consumption_sync() RETURNS trigger AS $$
+                        BEGIN
+                            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                                UPDATE user_month_consumption SET total = total - OLD.quantity
+                                WHERE user_id = OLD.user_id AND period = {month_of.format(row='OLD')};
+                            END IF;
+                            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                                INSERT INTO user_month_consumption (user_id, period, total)
+                                VALUES (NEW.user_id, {month_of.format(row='NEW')}, NEW.quantity)
+                                ON CONFLICT (user_id, period)
+                                DO UPDATE SET total = user_month_consumption.total + EXCLUDED.total;
+                            END IF;
+                            RETURN NULL;
+                        END;
+                        $$ LANGUAGE plpgsql
+                    """))
+                    backfill = db.session.execute(text(
+                        "SELECT 1 FROM pg_trigger WHERE tgname = 'trg_user_month_consumption' "
+                        "AND tgrelid = 'consumptions'::regclass"
+                    )).first() is None
+                    if backfill:
+                        # CREATE TRIGGER locks out writes to consumptions until the backfill commits
+                        db.session.execute(text(
+                            "CREATE TRIGGER trg_user_month_consumption "
+                            "AFTER INSERT OR UPDATE OF user_id, quantity, created_at OR DELETE ON consumptions "
+                            "FOR EACH ROW EXECUTE PROCEDURE user_month_consumption_sync()"
+                        ))
+                    rebuild_period = "date_trunc('month', created_at)::date"
+                elif dialect == 'sqlite':
+                    month_of = "date({row}.created_at, 'start of month')"
+                    subtract_old = (
+                        "UPDATE user_month_consumption SET total = total - OLD.quantity "
+                        f"WHERE user_id = OLD.user_id AND period = {month_of.format(row='OLD')};"
+                    )
+                    add_new = (
+                        "INSERT INTO user_month_consumption (user_id, period, total) "
+                        f"VALUES (NEW.user_id, {month_of.format(row='NEW')}, NEW.quantity) "
+                        "ON CONFLICT (user_id, period) DO UPDATE SET total = total + excluded.total;"
+                    )
+                    backfill = db.session.execute(text(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_umc_insert'"
+                    )).first() is None
+                    if backfill:
+                        # The DELETE opens the write transaction first, so no other writer can
+                        # slip in between creating the triggers and the backfill
+                        db.session.execute(text("DELETE FROM user_month_consumption"))
+                    db.session.execute(text(f"CREATE TRIGGER IF NOT EXISTS trg_umc_insert AFTER INSERT ON consumptions BEGIN {add_new} END"))
+                    db.session.execute(text(f"CREATE TRIGGER IF NOT EXISTS trg_umc_delete AFTER DELETE ON consumptions BEGIN {subtract_old} END"))
+                    db.session.execute(text(
+                        "CREATE TRIGGER IF NOT EXISTS trg_umc_update AFTER UPDATE OF user_id, quantity, created_at "
+                        f"ON consumptions BEGIN {subtract_old} {add_new} END"
+                    ))
+                    rebuild_period = "date(created_at, 'start of month')"
+                else:
+                    rebuild_period = None
+                    print(f"INFO: Unsupported dialect for consumption rollup triggers: {dialect}")
+
+                if rebuild_period and backfill:
+                    db.session.execute(text("DELETE FROM user_month_consumption"))
+                    db.session.execute(text(
+                        "INSERT INTO user_month_consumption (user_id, period, total) "
+                        f"SELECT user_id, {rebuild_period}, SUM(quantity) FROM consumptions "
+                        f"GROUP BY user_id, {rebuild_period}"
+                    ))
+                    print("INFO: Created user_month_consumption triggers and backfilled totals")
+                db.session.commit()
+            except Exception as e:
+                print(f"WARNING: Could not set up user_month_consumption rollup: {e}")
+                db.session.rollback()
+
         # Ensure Guests role exists
         try:
             from .models import roles
@@ -167,6 +353,19 @@ def create_app():
                 print("Guests role created successfully")
             else:
                 print("Guests role already exists")
+            # Older databases may hold a guest user without the itsl_id = -1 sentinel that
+            # get_or_create_guest_user upserts on; tag it so no duplicate gets created
+            from .models import users
+            if not users.query.filter_by(itsl_id=-1).first():
+                legacy_guest = users.query.filter(
+                    users.role_id.in_([4, guests_role.id]),
+                    users.first_name == 'Guests',
+                    users.last_name == '',
+                    users.itsl_id.is_(None)
+                ).order_by(users.id).first()
+                if legacy_guest:
+                    legacy_guest.itsl_id = -1
+                    db.session.commit()
         except Exception as e:
             print(f"WARNING: Could not create/verify Guests role: {e}")
             db.session.rollback()
@@ -199,10 +398,41 @@ def create_app():
     print("Database startup checks complete")
 
     _start_paypal_background_worker(app)
+    _start_access_log_writer(app)
 
     return app
 
 
+def _start_access_log_writer(app: Flask) -> None:
+    """Background thread that batches admin access log inserts off the request path."""
+    if app.config.get("_access_log_writer_started"):
+        return
+    app.config["_access_log_writer_started"] = True
+
+    def _writer():
+        from .models import admin_access_logs
+
+        with app.app_context():
+            while True:
+                batch = [access_log_queue.get()]
+                # Give concurrent logins a moment to join the same commit
+                time.sleep(0.5)
+                while True:
+                    try:
+                        batch.append(access_log_queue.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    db.session.bulk_insert_mappings(admin_access_logs, batch)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception("Failed to write %d admin access log(s)", len(batch))
+
+    thread = threading.Thread(target=_writer, name="access-log-writer", daemon=True)
+    thread.start()
+
+
 def _start_paypal_background_worker(app: Flask) -> None:
     """Background thread that periodically tries to auto-confirm pending PayPal payments."""
     if not app.config.get("PAYPAL_BACKGROUND_POLL_ENABLED", True):
@@ -1,6 +1,7 @@
 from datetime import datetime
 
 from flask import current_app
+from sqlalchemy import func
 
 from . import db
 from .models import cashbook_entries, users
@@ -17,22 +18,26 @@ def get_auto_cashbook_company() -> str:
 
 def get_next_beleg_nummer(company: str) -> int:
     """Return the next sequential receipt number for the given company."""
+    # MAX over the (company, beleg_nummer) unique index is a single index probe
     last = (
-        cashbook_entries.query.filter_by(company=company)
-        .order_by(cashbook_entries.beleg_nummer.desc())
-        .first()
+        db.session.query(func.max(cashbook_entries.beleg_nummer))
+        .filter_by(company=company)
+        .scalar()
     )
-    return (last.beleg_nummer + 1) if last else 1
+    return (last or 0) + 1
 
 
 def get_current_kassenstand(company: str) -> int:
     """Return the latest cash balance in cents for the given company."""
+    # Served by ix_cashbook_company_date_id; only the balance column is loaded
     last = (
-        cashbook_entries.query.filter_by(company=company)
+        db.session.query(cashbook_entries.kassenstand_bar_cents)
+        .filter_by(company=company)
         .order_by(cashbook_entries.entry_date.desc(), cashbook_entries.id.desc())
-        .first()
+        .limit(1)
+        .scalar()
     )
-    return last.kassenstand_bar_cents if last else 0
+    return last if last is not None else 0
 
 
 def recalculate_kassenstand_from_entry(company: str, entry_id: int) -> None:
@@ -4,6 +4,21 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-key")
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///local.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Compiled-statement cache: larger than SQLAlchemy's default 500 so the many distinct
+    # route statements stay compiled instead of being evicted and recompiled.
+    # Connection pool: pre-ping drops connections the server closed, recycle retires them
+    # before idle timeouts, LIFO keeps the warm ones in use. The file-based SQLite setup
+    # keeps SQLAlchemy's pool defaults.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "query_cache_size": int(os.getenv("DB_QUERY_CACHE_SIZE", "1200")),
+        **({} if SQLALCHEMY_DATABASE_URI.startswith("sqlite") else {
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            "pool_pre_ping": True,
+            "pool_recycle": 1800,
+            "pool_use_lifo": True,
+        }),
+    }
     
     # myPOS Device Configuration
     MYPOS_DEVICE_URL = os.getenv("MYPOS_DEVICE_URL", "http://192.168.1.100:8080")
@@ -13,7 +13,7 @@ class beverage_prices(db.Model):
         db.UniqueConstraint('role_id', 'beverage_id', name='uq_beverage_prices_role_beverage'),
     )
     id = db.Column(db.Integer, primary_key=True)
-    role_id = db.Column(db.Integer, db.ForeignKey("roles.id"), nullable=False)
+    role_id = db.Column(db.Integer, db.ForeignKey("roles.id", ondelete="CASCADE"), nullable=False)
     beverage_id = db.Column(db.Integer, db.ForeignKey("beverages.id"), nullable=False)
     price_cents = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -62,12 +62,14 @@ class display_items(db.Model):
 class consumptions(db.Model):
     __tablename__ = "consumptions"
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     beverage_id = db.Column(db.Integer, db.ForeignKey("beverages.id"), nullable=False)
     beverage_price_id = db.Column(db.Integer, db.ForeignKey("beverage_prices.id"), nullable=False)
     invoice_id = db.Column(db.Integer, db.ForeignKey("invoices.id"), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     unit_price_cents = db.Column(db.Integer, nullable=False)
+    # Line total maintained by the database (generated column, never written by the app)
+    total_cost_cents = db.Column(db.Integer, db.Computed('quantity * unit_price_cents', persisted=True))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
     # Relationships
@@ -82,7 +84,7 @@ class invoices(db.Model):
         db.UniqueConstraint('user_id', 'period', name='uq_invoices_user_period'),
     )
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     invoice_name = db.Column(db.String(120), unique=True, nullable=False)
     status = db.Column(db.String(20), nullable=False, default="draft")  # draft, sent, paid, overdue, void
     period = db.Column(db.Date, default=lambda: datetime.utcnow().replace(day=1).date(), nullable=False)
@@ -94,6 +96,18 @@ class invoices(db.Model):
     # Relationships
     user = db.relationship('users', backref='invoices')
 
+class user_month_consumption(db.Model):
+    """Per-user monthly consumption totals, kept in sync by database triggers on consumptions."""
+    __tablename__ = "user_month_consumption"
+    user_id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.Date, primary_key=True)  # first day of the month
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+class monthly_invoice_counters(db.Model):
+    __tablename__ = "monthly_invoice_counters"
+    period = db.Column(db.Date, primary_key=True)  # first day of the month
+    last_seq = db.Column(db.Integer, nullable=False, default=0)  # last number issued for the period
+
 class payments(db.Model):
     __tablename__ = "payments"
     id = db.Column(db.Integer, primary_key=True)
@@ -137,6 +151,12 @@ class settings(db.Model):
         row = settings.query.filter_by(key=key).first()
         return row.value if row else default
 
+    @staticmethod
+    def get_values(defaults: dict):
+        """Read several keys in one query; missing or empty values fall back to defaults."""
+        rows = dict(db.session.query(settings.key, settings.value).filter(settings.key.in_(defaults)).all())
+        return {key: rows.get(key) or default for key, default in defaults.items()}
+
     @staticmethod
     def set_value(key: str, value: str):
         row = settings.query.filter_by(key=key).first()
@@ -1,9 +1,18 @@
+import time
 from datetime import datetime
 
 from . import db
 from .models import users, persistent_pins
 
 
+# identifier -> expiry for users known to have no archived PIN, so PIN-less users
+# don't cost an archive lookup on every page view. The cache is per process and
+# store_persistent_pin only clears it in the process that archived the PIN, so the
+# other port's process may miss a new archive entry for up to this many seconds.
+_NO_ARCHIVE_TTL_SECONDS = 5
+_no_archive_until = {}
+
+
 def _normalize(value: str | None) -> str:
     if not value:
         return ""
@@ -24,6 +33,7 @@ def store_persistent_pin(user, pin_hash: bytes):
     identifier = _compute_identifier(user)
     if not identifier or not pin_hash:
         return
+    _no_archive_until.pop(identifier, None)
     record = persistent_pins.query.filter_by(user_identifier=identifier).first()
     if not record:
         record = persistent_pins(user_identifier=identifier, pin_hash=pin_hash)
@@ -52,8 +62,12 @@ def restore_pin_for_user(user) -> bool:
     identifier = _compute_identifier(user)
     if not identifier:
         return False
+    now = time.time()
+    if _no_archive_until.get(identifier, 0) > now:
+        return False
     record = persistent_pins.query.filter_by(user_identifier=identifier).first()
     if not record:
+        _no_archive_until[identifier] = now + _NO_ARCHIVE_TTL_SECONDS
         return False
     user.pin_hash = record.pin_hash
     user.updated_at = datetime.utcnow()
@@ -1,22 +1,34 @@
-from flask import Blueprint, jsonify, render_template, request, redirect, url_for, flash, abort, session, Response, current_app, make_response
-from .models import roles, beverages, users, consumptions, invoices, beverage_prices, display_items, settings, cashbook_entries, user_payments, payment_consumptions, mypos_transactions, cash_payment_requests
-from . import db, cache
+from flask import Blueprint, jsonify, render_template, stream_template, request, redirect, url_for, flash, abort, session, Response, current_app, make_response, g
+from .models import roles, beverages, users, consumptions, invoices, monthly_invoice_counters, user_month_consumption, beverage_prices, display_items, settings, cashbook_entries, user_payments, payment_consumptions, mypos_transactions, cash_payment_requests
+from . import db, cache, access_log_queue
+from collections import defaultdict
 from datetime import datetime, date, timedelta
-from sqlalchemy import func
-from sqlalchemy.exc import IntegrityError
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from sqlalchemy import JSON, Date, and_, bindparam, cast, delete, event, func, insert, literal, literal_column, null, select, type_coerce, union_all, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased, joinedload
 import hashlib
+import hmac
 import os
+import re
+import secrets
+import threading
 import time
+try:
+    import orjson
+except ImportError:  # Fall back to Flask's stdlib encoder when orjson is not installed
+    orjson = None
 from .security import (
     require_admin_auth, require_security_gate, is_admin_mode,
-    bypass_pin_for_dev, get_security_info, verify_admin_credentials, SECURITY_GATE_ENABLED, is_admin_port
+    bypass_pin_for_dev, get_security_info, verify_admin_credentials, verify_cashbook_credentials,
+    SECURITY_GATE_ENABLED, is_admin_port
 )
 from .paypal_api import cancel_pending_payment
 from .paypal_api import refresh_paypal_payment_status
 from .pin_utils import store_persistent_pin, remove_persistent_pin, restore_pin_for_user
 from .cashbook_utils import (
     get_next_beleg_nummer,
-    get_current_kassenstand,
     log_payment_to_cashbook,
     recalculate_kassenstand_from_entry,
     recalculate_all_kassenstand,
@@ -24,6 +36,125 @@ from .cashbook_utils import (
 
 bp = Blueprint("routes", __name__)
 
+THEME_COLORS = {
+    'coffee': '#222222',
+    'spring': '#4CAF50',
+    'summer': '#FF9800',
+    'autumn': '#FF5722',
+    'winter': '#2196F3'
+}
+# The main page uses a warmer accent for the coffee theme
+INDEX_THEME_COLORS = {**THEME_COLORS, 'coffee': '#B65D24'}
+
+# Process-local cache for the active theme name (see current_theme)
+_theme_cache = {'value': None, 'expires': 0.0}
+THEME_CACHE_TTL_SECONDS = 60
+
+def current_theme():
+    """Return the active theme name, cached for a short TTL to skip the settings lookup."""
+    now = time.time()
+    if now < _theme_cache['expires']:
+        return _theme_cache['value']
+    theme = settings.get_value('theme', 'coffee') or 'coffee'
+    _theme_cache.update(value=theme, expires=now + THEME_CACHE_TTL_SECONDS)
+    return theme
+
+def theme_bundle():
+    """Return (theme, theme_color) for templates, using the cached theme name."""
+    theme = current_theme()
+    return theme, THEME_COLORS.get(theme, '#222222')
+
+def invalidate_theme_cache():
+    """Force the next current_theme() call to re-read the setting."""
+    _theme_cache['expires'] = 0.0
+
+# Process-local snapshot of the settings the entries pages read (see page_settings)
+_PAGE_SETTING_DEFAULTS = {'theme': 'coffee', 'theme_version': '1', 'payment_button_hidden': 'false'}
+_page_settings_cache = {'values': None, 'expires': 0.0}
+PAGE_SETTINGS_TTL_SECONDS = 30
+
+def page_settings():
+    """Return theme, theme_version and payment_button_hidden, read in one query and cached for a short TTL."""
+    now = time.time()
+    if now >= _page_settings_cache['expires']:
+        _page_settings_cache.update(
+            values=settings.get_values(_PAGE_SETTING_DEFAULTS),
+            expires=now + PAGE_SETTINGS_TTL_SECONDS
+        )
+    return _page_settings_cache['values']
+
+def invalidate_page_settings():
+    """Force the next page_settings() call to re-read the settings."""
+    _page_settings_cache['expires'] = 0.0
+
+# Process-local {role_id: name} map; roles are few and rarely renamed
+_role_names_cache = {'names': {}, 'expires': 0.0}
+ROLE_NAMES_TTL_SECONDS = 60
+
+def role_names():
+    """Return the cached {role_id: name} map, refreshing it every ROLE_NAMES_TTL_SECONDS."""
+    now = time.time()
+    if now >= _role_names_cache['expires']:
+        _role_names_cache['names'] = dict(db.session.query(roles.id, roles.name).all())
+        _role_names_cache['expires'] = now + ROLE_NAMES_TTL_SECONDS
+    return _role_names_cache['names']
+
+def invalidate_role_names():
+    """Force the next role_names() call to reload roles."""
+    _role_names_cache['expires'] = 0.0
+
+@bp.app_template_filter('role_name')
+def role_name_filter(role_id):
+    return role_names().get(role_id, '')
+
+@bp.before_request
+def _load_cashbook_user():
+    g.cashbook_user = session.get('cashbook_user', 'Admin')
+
+def _fk_cascades():
+    """True when the database applies the ON DELETE CASCADE foreign keys (PostgreSQL)."""
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+def _dialect_insert(model):
+    """INSERT construct with on_conflict_* support for the active database."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return pg_insert(model)
+    return sqlite_insert(model)
+
+def fast_json(obj):
+    """JSON response encoded with orjson (falls back to jsonify without it)."""
+    if orjson is None:
+        return jsonify(obj)
+    return Response(orjson.dumps(obj), mimetype='application/json')
+
+def _json_ints(data, *required, **optional):
+    """Read integer fields from a JSON body, required ones first, then keyword defaults.
+    Missing or null optional fields take their default. A missing or null required field
+    raises KeyError(name); a non-integer value raises ValueError naming the field.
+    """
+    values = []
+    for name, default in (*((name, None) for name in required), *optional.items()):
+        raw = data.get(name)
+        if raw is None:
+            raw = default
+        if raw is None:
+            raise KeyError(name)
+        try:
+            values.append(int(raw))
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be an integer, got {raw!r}")
+    return values
+
+def _euros_to_cents(value) -> int:
+    """Parse a euro amount such as '1,50' or '1.50' into cents, rounding half up."""
+    try:
+        euros = Decimal(str(value).strip().replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {value!r}")
+    if not euros.is_finite():
+        raise ValueError(f"Invalid amount: {value!r}")
+    return int((euros * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
 def check_session_timeout():
     """Check if admin session has timed out (10 minutes)"""
     if os.getenv('FLASK_APP_MODE') == 'admin' and session.get('admin_authenticated'):
@@ -72,19 +203,45 @@ def require_admin_only(f):
 
 def clear_pin_sessions(except_user_id=None):
     """Remove stored PIN verifications to avoid cross-user reuse."""
-    keys_to_remove = [
-        key for key in list(session.keys())
-        if key.startswith('pin_verified_')
-    ]
-    for key in keys_to_remove:
-        user_suffix = key.replace('pin_verified_', '')
-        if except_user_id is not None and str(except_user_id) == user_suffix:
-            continue
-        session.pop(key, None)
+    verified = session.get('pin_verified')
+    if not verified:
+        return
+    keep = str(except_user_id)
+    if except_user_id is not None and keep in verified:
+        session['pin_verified'] = {keep: verified[keep]}
+    else:
+        session.pop('pin_verified', None)
+
+def mark_pin_verified(user_id):
+    """Record a successful PIN check for user_id in the session."""
+    # Reassign rather than mutate so the session notices the change
+    session['pin_verified'] = {**session.get('pin_verified', {}), str(user_id): time.time()}
+
+def is_pin_verified(user_id):
+    return str(user_id) in session.get('pin_verified', {})
+
+def _next_invoice_seq(period: date) -> int:
+    """Atomically reserve the next invoice number for a month."""
+    bump = update(monthly_invoice_counters)\
+        .where(monthly_invoice_counters.period == period)\
+        .values(last_seq=monthly_invoice_counters.last_seq + 1)\
+        .returning(monthly_invoice_counters.last_seq)
+    seq = db.session.execute(bump).scalar()
+    if seq is None:
+        # First invoice of the month since counters were introduced: seed from existing invoices
+        existing = select(func.count(invoices.id)).where(invoices.period == period).scalar_subquery()
+        db.session.execute(
+            _dialect_insert(monthly_invoice_counters)
+            .values(period=period, last_seq=existing)
+            .on_conflict_do_nothing(index_elements=["period"])
+        )
+        seq = db.session.execute(bump).scalar()
+    return seq
 
-def check_invoice_exists(user_id, period: date | None = None):
+def check_invoice_exists(user_id, period: date | None = None, commit: bool = True):
     """Get or create an invoice for the user and target month.
-    If period is None, defaults to current month.
+    If period is None, defaults to current month. With commit=False a new invoice
+    is only flushed and the caller's transaction decides whether it is kept.
     """
     current_month_year = (period or date.today()).replace(day=1)
     existing_invoice = invoices.query.filter_by(
@@ -107,122 +264,228 @@ def check_invoice_exists(user_id, period: date | None = None):
         if not user:
             raise ValueError(f"User with ID {user_id} not found")
     
-    count = invoices.query.filter_by(period=current_month_year).count()
-    invoice_name = f"INV-{current_month_year.strftime('%Y-%m')}_{count + 1}"
+    invoice_name = f"INV-{current_month_year.strftime('%Y-%m')}_{_next_invoice_seq(current_month_year)}"
 
-    new_invoice = invoices(
+    # Atomic create: a concurrent request that wins the race makes this a no-op
+    # (uq_invoices_user_period) instead of a failed commit and rollback
+    stmt = _dialect_insert(invoices).values(
         user_id=user_id,
         invoice_name=invoice_name,
         status="draft",
         period=current_month_year
-    )
+    ).on_conflict_do_nothing(index_elements=["user_id", "period"]).returning(invoices)
 
     try:
-        db.session.add(new_invoice)
-        db.session.commit()
-        return new_invoice
-    except IntegrityError:
-        # Another concurrent request likely created the invoice; rollback and fetch it
+        new_invoice = db.session.scalars(stmt).first()
+        if commit:
+            db.session.commit()
+    except Exception as e:
         db.session.rollback()
-        existing_invoice = invoices.query.filter_by(
+        raise Exception(f"Failed to create invoice: {str(e)}")
+
+    if new_invoice is None:
+        new_invoice = invoices.query.filter_by(
             user_id=user_id,
             period=current_month_year
         ).first()
-        if existing_invoice:
-            return existing_invoice
-        # If still not found, rethrow a generic error to surface the issue
-        raise
-    except Exception as e:
-        db.session.rollback()
-        raise Exception(f"Failed to create invoice: {str(e)}")
+    return new_invoice
+
+# Process-local id of the synthetic guest user, resolved once by get_or_create_guest_user
+_guest_user_cache = {'id': None}
 
 def get_or_create_guest_user():
     """Return a persistent synthetic 'Guests' user under role 'Guests' (id 4 if present).
     Identified by sentinel itsl_id = -1 to avoid colliding with real users.
     """
+    if _guest_user_cache['id'] is not None:
+        guest_user = db.session.get(users, _guest_user_cache['id'])
+        if guest_user:
+            return guest_user
+
     # Resolve Guests role id (prefer id 4, fallback to name lookup)
-    guests_role_id = 4
-    role_obj = roles.query.get(guests_role_id)
-    if not role_obj:
-        role_obj = roles.query.filter(roles.name.ilike('guests')).first()
-        if role_obj:
-            guests_role_id = role_obj.id
-
-    # Try by sentinel itsl_id
-    guest_user = users.query.filter_by(itsl_id=-1).first()
-    if guest_user:
-        return guest_user
-
-    # Fallback try by role/name combo to prevent duplicates if existed before
-    guest_user = users.query.filter_by(role_id=guests_role_id, first_name='Guests', last_name='').first()
-    if guest_user:
-        # ensure sentinel set for future lookups
-        if guest_user.itsl_id is None:
-            guest_user.itsl_id = -1
-            db.session.commit()
-        return guest_user
+    guests_role_id = db.session.query(roles.id)\
+        .filter((roles.id == 4) | roles.name.ilike('guests'))\
+        .order_by((roles.id != 4), roles.id)\
+        .limit(1).scalar() or 4
 
-    # Create
-    guest_user = users(
+    # Insert-or-fetch in one statement; the no-op update makes RETURNING yield the existing row
+    stmt = _dialect_insert(users).values(
         itsl_id=-1,
         role_id=guests_role_id,
         first_name='Guests',
         last_name='',
         email=None,
         status=True
-    )
-    db.session.add(guest_user)
+    ).on_conflict_do_update(index_elements=['itsl_id'], set_={'itsl_id': -1}).returning(users)
+    guest_user = db.session.scalars(stmt).one()
     db.session.commit()
+    _guest_user_cache['id'] = guest_user.id
     return guest_user
 
-def hash_pin(pin):
-    """Hash a PIN using SHA-256"""
-    return hashlib.sha256(pin.encode()).digest()
+PIN_SALT_BYTES = 16
+# scrypt cost for 4-digit PINs; salt + 32-byte key fits the 64-byte pin_hash column
+_PIN_SCRYPT_PARAMS = {'n': 2 ** 14, 'r': 8, 'p': 1, 'dklen': 32}
+# PINs stored before scrypt are bare SHA-256 digests
+_LEGACY_PIN_HASH_LEN = 32
+
+def hash_pin(pin, salt=None):
+    """Hash a PIN with scrypt; the stored value is salt + derived key"""
+    salt = salt or secrets.token_bytes(PIN_SALT_BYTES)
+    return salt + hashlib.scrypt(pin.encode(), salt=salt, **_PIN_SCRYPT_PARAMS)
+
+def _pin_matches(stored, pin):
+    """Constant-time check of a PIN against a stored scrypt or legacy SHA-256 hash"""
+    stored = bytes(stored)
+    if len(stored) == _LEGACY_PIN_HASH_LEN:
+        return hmac.compare_digest(stored, hashlib.sha256(pin.encode()).digest())
+    return hmac.compare_digest(stored, hash_pin(pin, stored[:PIN_SALT_BYTES]))
+
+# Stand-in hash checked when a user has no PIN, so that case costs the same scrypt run
+_DUMMY_PIN_HASH = secrets.token_bytes(PIN_SALT_BYTES + _PIN_SCRYPT_PARAMS['dklen'])
+
+# Recent successful PIN checks, so a resubmitted keypad entry skips scrypt.
+# Keys are an HMAC (process-random key) of the stored hash and the PIN, so no PIN is
+# kept in memory and a changed PIN never matches. Failures are never cached: they
+# always pay the full scrypt cost.
+_PIN_OK_KEY = secrets.token_bytes(32)
+_pin_ok_cache = {}
+_pin_ok_lock = threading.Lock()
+PIN_OK_TTL_SECONDS = 30
+_PIN_OK_MAX_ENTRIES = 256
+
+def _pin_ok_token(user_id, stored, pin):
+    return hmac.digest(_PIN_OK_KEY, b'%d:' % user_id + bytes(stored) + pin.encode(), 'sha256')
+
+def _remember_pin_ok(token):
+    now = time.time()
+    # Pruning iterates the dict, so writers are serialized against each other
+    with _pin_ok_lock:
+        if len(_pin_ok_cache) >= _PIN_OK_MAX_ENTRIES:
+            for key in [k for k, expires in _pin_ok_cache.items() if expires <= now]:
+                del _pin_ok_cache[key]
+            if len(_pin_ok_cache) >= _PIN_OK_MAX_ENTRIES:
+                _pin_ok_cache.clear()
+        _pin_ok_cache[token] = now + PIN_OK_TTL_SECONDS
 
 def verify_pin(user_id, pin):
-    """Verify a PIN against the stored hash"""
+    """Verify a PIN against the stored hash; unknown users fail the same way as wrong PINs."""
     user = users.query.get(user_id)
-    if not user or not user.pin_hash:
+    # Bring back a PIN lost in a restore before checking it
+    if restore_pin_for_user(user):
+        db.session.commit()
+    has_pin = bool(user and user.pin_hash)
+    if has_pin and _pin_ok_cache.get(_pin_ok_token(user.id, user.pin_hash, pin), 0) > time.time():
+        return True
+    # Always hash and compare so timing does not reveal whether the user exists or has a PIN
+    matched = _pin_matches(user.pin_hash if has_pin else _DUMMY_PIN_HASH, pin)
+    if not (matched and has_pin):
         return False
-    return user.pin_hash == hash_pin(pin)
+    if len(user.pin_hash) == _LEGACY_PIN_HASH_LEN:
+        # Upgrade legacy SHA-256 hashes to scrypt on successful verification
+        try:
+            user.pin_hash = hash_pin(pin)
+            store_persistent_pin(user, user.pin_hash)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"WARNING: Could not upgrade PIN hash for user {user_id}: {e}")
+    _remember_pin_ok(_pin_ok_token(user.id, user.pin_hash, pin))
+    return True
+
+# Main page data (users, roles, monthly consumption totals) is cached until one of
+# these tables changes; the entries page ETag also covers beverages and prices.
+# Writes mark the session; the commit stores a fresh 'users_version' setting so
+# every process sees the change.
+_INDEX_DATA_MODELS = (users, roles, consumptions, beverages, beverage_prices)
+INDEX_CACHE_SECONDS = 3600
+
+def mark_index_data_changed():
+    """Flag the current transaction as changing main page data (for bulk writes that skip flush events)."""
+    db.session.info['index_data_changed'] = True
+
+@event.listens_for(db.session, 'before_flush')
+def _track_index_data_flush(session, flush_context, instances):
+    if any(isinstance(obj, _INDEX_DATA_MODELS) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['index_data_changed'] = True
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _track_index_data_bulk(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in _INDEX_DATA_MODELS:
+            orm_execute_state.session.info['index_data_changed'] = True
+
+@event.listens_for(db.session, 'before_commit')
+def _bump_index_data_version(session):
+    if session.info.pop('index_data_changed', False):
+        settings.set_value('users_version', secrets.token_hex(8))
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _reset_index_data_flag(session, previous_transaction):
+    session.info.pop('index_data_changed', None)
+
+_INDEX_SETTING_DEFAULTS = {'theme': 'coffee', 'theme_version': '1', 'users_version': '1'}
+
+def index_settings():
+    """Settings the main page depends on, read in one query and memoized for the request."""
+    if 'index_settings' not in g:
+        g.index_settings = settings.get_values(_INDEX_SETTING_DEFAULTS)
+    return g.index_settings
+
+def _index_cache_key(prefix):
+    """Cache key covering theme, main page data version, port flavour and day."""
+    current = index_settings()
+    flavour = 'admin' if is_admin_port() else 'user'
+    return f"{prefix}:{current['theme_version']}:{current['users_version']}:{flavour}:{date.today().isoformat()}"
+
+# Main page user lists, built once at import so requests only bind the month.
+# Monthly totals come from the trigger-maintained user_month_consumption rollup.
+_index_month_total = func.coalesce(user_month_consumption.total, 0)
+_INDEX_USERS_STMT = select(
+    users.id,
+    users.first_name,
+    users.last_name,
+    roles.name.label('role'),
+    _index_month_total.label('total_consumption')
+).join(roles, users.role_id == roles.id)\
+ .outerjoin(user_month_consumption, and_(
+     user_month_consumption.user_id == users.id,
+     user_month_consumption.period == bindparam('month')
+ ))\
+ .order_by(_index_month_total.desc(), users.id)
+_INDEX_COUNT_STMT = select(func.count(users.id)).join(roles, users.role_id == roles.id)
+# The user port only lists active users
+_INDEX_ACTIVE_USERS_STMT = _INDEX_USERS_STMT.where(users.status == True)
+_INDEX_ACTIVE_COUNT_STMT = _INDEX_COUNT_STMT.where(users.status == True)
+
+def _index_statements():
+    """(users, count) statements for the main page; the admin port sees inactive users too."""
+    if is_admin_port():
+        return _INDEX_USERS_STMT, _INDEX_COUNT_STMT
+    return _INDEX_ACTIVE_USERS_STMT, _INDEX_ACTIVE_COUNT_STMT
+
+# Cards rendered server-side; the rest are fetched from /api/index-data
+INDEX_INITIAL_USERS = 12
 
 def _index_core():
-    current_month = date.today().replace(day=1)
-    base_query = db.session.query(
-        users,
-        roles,
-        func.coalesce(func.sum(consumptions.quantity), 0).label('total_consumption')
-    ).join(roles, users.role_id == roles.id) \
-     .outerjoin(consumptions, db.and_(consumptions.user_id == users.id, consumptions.created_at >= current_month)) \
-     .group_by(users.id, roles.id) \
-     .order_by(func.coalesce(func.sum(consumptions.quantity), 0).desc())
-
-    # Only hide inactive users on the user port; admin port sees all
-    if not is_admin_port():
-        base_query = base_query.filter(users.status == True)
-
-    users_with_consumption = base_query.all()
-    sorted_users = [u[0] for u in users_with_consumption]
+    users_stmt, count_stmt = _index_statements()
+    initial_subset = db.session.execute(
+        users_stmt.limit(INDEX_INITIAL_USERS), {'month': date.today().replace(day=1)}
+    ).all()
+    users_count = db.session.execute(count_stmt).scalar()
     # Only expose admin tools on admin port AND when admin session is authenticated
     is_admin = is_admin_mode()
-    initial_subset = sorted_users[:12]
-    theme = settings.get_value('theme', 'coffee') or 'coffee'
-    theme_version = settings.get_value('theme_version', '1') or '1'
-    theme_colors = {
-        'coffee': '#B65D24',
-        'spring': '#4CAF50',
-        'summer': '#FF9800',
-        'autumn': '#FF5722',
-        'winter': '#2196F3'
-    }
-    theme_color = theme_colors.get(theme, '#222222')
+    current = index_settings()
+    theme = current['theme']
+    theme_version = current['theme_version']
+    theme_color = INDEX_THEME_COLORS.get(theme, '#222222')
     # Check if in development mode
     is_dev = os.getenv('FLASK_ENV', 'production') == 'development'
     
     return render_template(
         'index.html',
         users=initial_subset,
-        users_count=len(sorted_users),
+        users_count=users_count,
         is_admin=is_admin,
         theme=theme,
         theme_version=theme_version,
@@ -252,54 +515,69 @@ def index():
     if request.args.get('require_pin', 'false').lower() != 'true':
         clear_pin_sessions()
     
-    theme_version = settings.get_value('theme_version', '1') or '1'
-    cache_key = f"index:{theme_version}:{'admin' if is_admin_port() else 'user'}"
+    cache_key = _index_cache_key('index')
+    # The cache key already covers everything the page depends on, so it doubles as the ETag
+    etag = hashlib.blake2b(cache_key.encode(), digest_size=8).hexdigest()
+    if etag in request.if_none_match:
+        return _index_response('', etag)
     try:
         cached = cache.get(cache_key)
         if cached is not None:
-            return cached
+            return _index_response(cached, etag)
     except Exception as e:
         # If cache fails, just continue without caching
         print(f"WARNING: Cache get failed, continuing without cache: {e}")
     rv = _index_core()
     try:
-        cache.set(cache_key, rv, timeout=30)
+        cache.set(cache_key, rv, timeout=INDEX_CACHE_SECONDS)
     except Exception as e:
         # If cache set fails, just continue without caching
         print(f"WARNING: Cache set failed, continuing without cache: {e}")
-    return rv
+    return _index_response(rv, etag)
+
+def _index_response(body, etag):
+    """Wrap the main page with its ETag; make_conditional turns matching revalidations into 304s."""
+    resp = make_response(body)
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, max-age=30, must-revalidate'
+    return resp.make_conditional(request)
 
 @bp.route('/api/index-data')
 def api_index_data():
-    """Lightweight API to allow progressive loading of the main page user list."""
-    current_month = date.today().replace(day=1)
-    base_query = db.session.query(
-        users.id,
-        users.first_name,
-        users.last_name,
-        roles.name.label('role_name'),
-        func.coalesce(func.sum(consumptions.quantity), 0).label('total_consumption')
-    ).join(roles, users.role_id == roles.id) \
-     .outerjoin(consumptions, db.and_(consumptions.user_id == users.id, consumptions.created_at >= current_month)) \
-     .group_by(users.id, roles.id) \
-     .order_by(func.coalesce(func.sum(consumptions.quantity), 0).desc())
-
-    # Only hide inactive users on the user port; admin port sees all
-    if not is_admin_port():
-        base_query = base_query.filter(users.status == True)
-
-    users_with_consumption = base_query.all()
+    """Lightweight API to allow progressive loading of the main page user list.
+    Optional ?offset=&limit= return a slice; 'count' is always the full total.
+    """
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(limit, 0)
+    cache_key = f"{_index_cache_key('index-data')}:{offset}:{limit}"
+    try:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return fast_json(cached)
+    except Exception as e:
+        # If cache fails, just continue without caching
+        print(f"WARNING: Cache get failed, continuing without cache: {e}")
 
-    data = [
-        {
-            'id': row.id,
-            'first_name': row.first_name,
-            'last_name': row.last_name,
-            'role': row.role_name,
-            'total_consumption': int(row.total_consumption or 0)
-        } for row in users_with_consumption
-    ]
-    return jsonify({'users': data, 'count': len(data)})
+    users_stmt, count_stmt = _index_statements()
+    if offset:
+        users_stmt = users_stmt.offset(offset)
+    if limit is not None:
+        users_stmt = users_stmt.limit(limit)
+    # Rows are labelled to match the JSON keys
+    data = [row._asdict() for row in db.session.execute(users_stmt, {'month': date.today().replace(day=1)})]
+    if offset or limit is not None:
+        total = db.session.execute(count_stmt).scalar()
+    else:
+        total = len(data)
+    payload = {'users': data, 'count': total}
+    try:
+        cache.set(cache_key, payload, timeout=INDEX_CACHE_SECONDS)
+    except Exception as e:
+        # If cache set fails, just continue without caching
+        print(f"WARNING: Cache set failed, continuing without cache: {e}")
+    return fast_json(payload)
 
 
 @bp.route("/dev/add_user", methods=["GET", "POST"])
@@ -421,13 +699,73 @@ def dev_beverages():
             return jsonify({"success": False, "error": f"Failed to create beverage: {str(e)}"}), 500
 
     include_all = request.args.get('all', type=int) == 1
-    query = beverages.query
+    # Column rows labelled like the JSON keys; no ORM instances needed for a listing
+    stmt = select(beverages.id, beverages.name, beverages.category, beverages.status)
     if not include_all:
-        query = query.filter_by(status=True)
-    rows = query.order_by(beverages.id.asc()).all()
-    return jsonify([
-        {"id": r.id, "name": r.name, "category": r.category, "status": r.status} for r in rows
-    ])
+        stmt = stmt.where(beverages.status == True)
+    rows = db.session.execute(stmt.order_by(beverages.id.asc()))
+    return jsonify([row._asdict() for row in rows])
+
+def _apply_role_prices(role_ids, prices):
+    """Set the given [{beverage_id, price_cents}] prices for every role in role_ids.
+    Returns (updated, created, duplicates_cleaned); the caller commits.
+    """
+    # Requested prices per beverage (last entry wins for repeated beverages)
+    requested = {}
+    for price_data in prices:
+        beverage_id = price_data.get("beverage_id")
+        price_cents = price_data.get("price_cents")
+        if beverage_id is None or price_cents is None:
+            continue
+        try:
+            requested[beverage_id] = int(price_cents)
+        except (TypeError, ValueError):
+            continue
+
+    # One read of the roles' existing prices, keyed by (role_id, beverage_id)
+    existing = {}
+    duplicate_ids = []
+    for row in db.session.query(
+        beverage_prices.id, beverage_prices.role_id, beverage_prices.beverage_id, beverage_prices.price_cents
+    ).filter(beverage_prices.role_id.in_(role_ids)).order_by(beverage_prices.id):
+        key = (row.role_id, row.beverage_id)
+        if key in existing:
+            duplicate_ids.append(row.id)
+        else:
+            existing[key] = row.price_cents
+
+    # Clean duplicate rows that are not referenced by any consumptions
+    cleaned = 0
+    if duplicate_ids:
+        referenced = select(consumptions.beverage_price_id).where(consumptions.beverage_price_id.in_(duplicate_ids))
+        cleaned = beverage_prices.query.filter(
+            beverage_prices.id.in_(duplicate_ids),
+            beverage_prices.id.not_in(referenced)
+        ).delete(synchronize_session=False)
+
+    updated = 0
+    created = 0
+    values = []
+    for role_id in role_ids:
+        for beverage_id, price_cents in requested.items():
+            current = existing.get((role_id, beverage_id))
+            if current is None:
+                created += 1
+            elif current != price_cents:
+                updated += 1
+            else:
+                continue
+            values.append({"role_id": role_id, "beverage_id": beverage_id, "price_cents": price_cents})
+
+    # Single upsert for every new or changed (role, beverage) price
+    if values:
+        stmt = _dialect_insert(beverage_prices).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["role_id", "beverage_id"],
+            set_={"price_cents": stmt.excluded.price_cents, "updated_at": datetime.utcnow()}
+        )
+        db.session.execute(stmt)
+    return updated, created, cleaned
 
 @bp.route("/dev/prices", methods=["GET", "POST"])
 def dev_prices():
@@ -453,50 +791,7 @@ def dev_prices():
             if not role:
                 return jsonify({"success": False, "error": "Role not found"}), 404
 
-            # Fetch existing prices for role (to update instead of deleting to preserve FK integrity)
-            existing_rows = beverage_prices.query.filter_by(role_id=role_id).all()
-            existing_map = {}
-            duplicates = []
-            for row in existing_rows:
-                if row.beverage_id in existing_map:
-                    duplicates.append(row)
-                else:
-                    existing_map[row.beverage_id] = row
-
-            updated = 0
-            created = 0
-
-            for price_data in prices:
-                beverage_id = price_data.get("beverage_id")
-                price_cents = price_data.get("price_cents")
-                if beverage_id is None or price_cents is None:
-                    continue
-                try:
-                    price_cents = int(price_cents)
-                except (TypeError, ValueError):
-                    continue
-
-                # Update existing or create new
-                existing = existing_map.get(beverage_id)
-                if existing:
-                    if existing.price_cents != price_cents:
-                        existing.price_cents = price_cents
-                        updated += 1
-                else:
-                    new_price = beverage_prices(
-                        role_id=role_id,
-                        beverage_id=beverage_id,
-                        price_cents=price_cents
-                    )
-                    db.session.add(new_price)
-                    created += 1
-
-            # Attempt to clean duplicate rows that are not referenced by any consumptions
-            cleaned_duplicates = 0
-            for dup in duplicates:
-                if not dup.consumptions:  # safe to delete
-                    db.session.delete(dup)
-                    cleaned_duplicates += 1
+            updated, created, cleaned_duplicates = _apply_role_prices([role.id], prices)
 
             db.session.commit()
             msg = (f"Prices processed for role '{role.name}': {updated} updated, {created} created"
@@ -526,22 +821,24 @@ def dev_prices():
                 "price_cents": price.price_cents
             } for price in existing_prices])
         else:
-            # Return all roles with their prices
+            # Return all roles with their prices (one query for all prices, grouped here)
             all_roles = roles.query.all()
-            result = []
-            
-            for role in all_roles:
-                role_prices = beverage_prices.query.filter_by(role_id=role.id).all()
-                result.append({
-                    "role_id": role.id,
-                    "role_name": role.name,
-                    "prices": [{
-                        "beverage_id": price.beverage_id,
-                        "price_cents": price.price_cents
-                    } for price in role_prices]
+            prices_by_role = defaultdict(list)
+            for price in db.session.query(
+                beverage_prices.role_id,
+                beverage_prices.beverage_id,
+                beverage_prices.price_cents
+            ):
+                prices_by_role[price.role_id].append({
+                    "beverage_id": price.beverage_id,
+                    "price_cents": price.price_cents
                 })
             
-            return jsonify(result)
+            return jsonify([{
+                "role_id": role.id,
+                "role_name": role.name,
+                "prices": prices_by_role.get(role.id, [])
+            } for role in all_roles])
     except Exception as e:
         return jsonify({"success": False, "error": f"Failed to load prices: {str(e)}"}), 500
 
@@ -559,61 +856,12 @@ def dev_prices_unified():
         return jsonify({"success": False, "error": "Prices are required"}), 400
     
     try:
-        # Get all roles
-        all_roles = roles.query.all()
-        if not all_roles:
+        # Get all role ids
+        role_ids = [role_id for role_id, in db.session.query(roles.id)]
+        if not role_ids:
             return jsonify({"success": False, "error": "No roles found"}), 400
 
-        total_updated = 0
-        total_created = 0
-        total_cleaned = 0
-
-        for role in all_roles:
-            existing_rows = beverage_prices.query.filter_by(role_id=role.id).all()
-            existing_map = {}
-            duplicates = []
-            for row in existing_rows:
-                if row.beverage_id in existing_map:
-                    duplicates.append(row)
-                else:
-                    existing_map[row.beverage_id] = row
-
-            updated = 0
-            created = 0
-
-            for price_data in prices:
-                beverage_id = price_data.get("beverage_id")
-                price_cents = price_data.get("price_cents")
-                if beverage_id is None or price_cents is None:
-                    continue
-                try:
-                    price_cents = int(price_cents)
-                except (TypeError, ValueError):
-                    continue
-
-                existing = existing_map.get(beverage_id)
-                if existing:
-                    if existing.price_cents != price_cents:
-                        existing.price_cents = price_cents
-                        updated += 1
-                else:
-                    new_price = beverage_prices(
-                        role_id=role.id,
-                        beverage_id=beverage_id,
-                        price_cents=price_cents
-                    )
-                    db.session.add(new_price)
-                    created += 1
-
-            cleaned_duplicates = 0
-            for dup in duplicates:
-                if not dup.consumptions:
-                    db.session.delete(dup)
-                    cleaned_duplicates += 1
-
-            total_updated += updated
-            total_created += created
-            total_cleaned += cleaned_duplicates
+        total_updated, total_created, total_cleaned = _apply_role_prices(role_ids, prices)
 
         db.session.commit()
         msg = (f"Unified prices processed: {total_updated} updated, {total_created} created"
@@ -650,6 +898,7 @@ def dev_roles_manage():
             new_role = roles(name=name)
             db.session.add(new_role)
             db.session.commit()
+            invalidate_role_names()
             
             return jsonify({
                 "success": True,
@@ -672,26 +921,27 @@ def dev_delete_role(role_id):
         abort(404)
     
     try:
-        role = roles.query.get(role_id)
-        if not role:
-            return jsonify({"success": False, "error": "Role not found"}), 404
-        
-        # Check if role has users
-        user_count = users.query.filter_by(role_id=role_id).count()
-        if user_count > 0:
+        # beverage_prices cascade on PostgreSQL; SQLite does not enforce foreign keys here
+        if not _fk_cascades():
+            db.session.execute(delete(beverage_prices).where(beverage_prices.role_id == role_id))
+        # Roles with users are left alone; the guard is part of the DELETE itself
+        role_name = db.session.execute(
+            delete(roles)
+            .where(roles.id == role_id, ~select(users.id).where(users.role_id == role_id).exists())
+            .returning(roles.name)
+        ).scalar()
+        if role_name is None:
+            db.session.rollback()
+            role = db.session.get(roles, role_id)
+            if not role:
+                return jsonify({"success": False, "error": "Role not found"}), 404
+            user_count = users.query.filter_by(role_id=role_id).count()
             return jsonify({
                 "success": False, 
                 "error": f"Cannot delete role '{role.name}' - it has {user_count} user(s) assigned. Delete users first."
             }), 400
-        
-        # Delete related beverage_prices first (foreign key constraint)
-        beverage_prices_count = beverage_prices.query.filter_by(role_id=role_id).count()
-        if beverage_prices_count > 0:
-            beverage_prices.query.filter_by(role_id=role_id).delete()
-        
-        role_name = role.name
-        roles.query.filter_by(id=role_id).delete()
         db.session.commit()
+        invalidate_role_names()
         
         return jsonify({
             "success": True,
@@ -702,6 +952,24 @@ def dev_delete_role(role_id):
         db.session.rollback()
         return jsonify({"success": False, "error": f"Failed to delete role: {str(e)}"}), 500
 
+def _delete_user(user_id):
+    """Delete one user and their data; returns (payload, status) and leaves committing to the caller."""
+    # consumptions and invoices cascade on PostgreSQL; SQLite does not enforce foreign keys here
+    if not _fk_cascades():
+        db.session.execute(delete(consumptions).where(consumptions.user_id == user_id))
+        db.session.execute(delete(invoices).where(invoices.user_id == user_id))
+    deleted = db.session.execute(
+        delete(users).where(users.id == user_id).returning(users.first_name, users.last_name)
+    ).first()
+    if deleted is None:
+        return {"success": False, "error": "User not found"}, 404
+    
+    user_name = f"{deleted.first_name} {deleted.last_name}"
+    return {
+        "success": True,
+        "message": f"User '{user_name}' and all related data deleted successfully"
+    }, 200
+
 @bp.route("/dev/delete_user/<int:user_id>", methods=["DELETE"])
 def dev_delete_user(user_id):
     """Development-only individual user deletion."""
@@ -710,25 +978,7 @@ def dev_delete_user(user_id):
         abort(404)
     
     try:
-        user = users.query.get(user_id)
-        if not user:
-            return jsonify({"success": False, "error": "User not found"}), 404
-        
-        user_name = f"{user.first_name} {user.last_name}"
-        
-        # Delete related data first
-        consumptions.query.filter_by(user_id=user_id).delete()
-        invoices.query.filter_by(user_id=user_id).delete()
-        
-        # Delete the user
-        users.query.filter_by(id=user_id).delete()
-        db.session.commit()
-        
-        return jsonify({
-            "success": True,
-            "message": f"User '{user_name}' and all related data deleted successfully"
-        })
-        
+        return _run_admin_op(_delete_user, user_id)
     except Exception as e:
         db.session.rollback()
         return jsonify({"success": False, "error": f"Failed to delete user: {str(e)}"}), 500
@@ -783,22 +1033,26 @@ def dev_update_user(user_id):
         data = request.get_json() or {}
         first_name = (data.get('first_name') or '').strip()
         last_name = (data.get('last_name') or '').strip()
-        role_id = data.get('role_id')
-        if not first_name or not last_name or role_id is None:
-            return jsonify({'success': False, 'error': 'first_name, last_name and role_id are required'}), 400
         try:
-            role_id = int(role_id)
-        except (TypeError, ValueError):
+            role_id, = _json_ints(data, 'role_id')
+        except KeyError:
+            role_id = None
+        except ValueError:
             return jsonify({'success': False, 'error': 'Invalid role_id'}), 400
-        user = users.query.get(user_id)
-        if not user:
-            return jsonify({'success': False, 'error': 'User not found'}), 404
-        role = roles.query.get(role_id)
-        if not role:
+        if not first_name or not last_name or role_id is None:
+            return jsonify({'success': False, 'error': 'first_name, last_name and role_id are required'}), 400
+        # One guarded UPDATE; only on a miss do we look up which id was wrong
+        updated = db.session.execute(
+            update(users)
+            .where(users.id == user_id, select(roles.id).where(roles.id == role_id).exists())
+            .values(first_name=first_name, last_name=last_name, role_id=role_id)
+            .returning(users.id)
+        ).scalar()
+        if updated is None:
+            db.session.rollback()
+            if db.session.get(users, user_id) is None:
+                return jsonify({'success': False, 'error': 'User not found'}), 404
             return jsonify({'success': False, 'error': 'Role not found'}), 404
-        user.first_name = first_name
-        user.last_name = last_name
-        user.role_id = role_id
         db.session.commit()
         return jsonify({'success': True, 'message': 'User updated successfully'})
     except Exception as e:
@@ -813,26 +1067,36 @@ def dev_users_manage():
         abort(404)
     
     try:
-        all_users = db.session.query(users, roles).join(roles, users.role_id == roles.id).all()
-        users_data = []
-        
-        for user, role in all_users:
-            users_data.append({
-                "id": user.id,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "email": user.email,
-                "role_name": role.name,
-                "role_id": user.role_id,
-                "has_pin": user.pin_hash is not None,
-                "status": user.status
-            })
-        
-        return jsonify(users_data)
+        # Plain column rows labelled to match the JSON keys; pin_hash itself never leaves the database
+        users_data = [row._asdict() for row in db.session.query(
+            users.id,
+            users.first_name,
+            users.last_name,
+            users.email,
+            roles.name.label('role_name'),
+            users.role_id,
+            users.pin_hash.isnot(None).label('has_pin'),
+            users.status
+        ).join(roles, users.role_id == roles.id)]
+        
+        return fast_json(users_data)
         
     except Exception as e:
         return jsonify({"success": False, "error": f"Failed to load users: {str(e)}"}), 500
 
+def _toggle_user_status(user_id):
+    """Flip one user's visibility; returns (payload, status) and leaves committing to the caller."""
+    status = db.session.execute(
+        update(users).where(users.id == user_id).values(status=~users.status).returning(users.status)
+    ).scalar()
+    if status is None:
+        return {"success": False, "error": "User not found"}, 404
+    return {
+        "success": True, 
+        "status": status,
+        "message": f"User {'hidden' if not status else 'shown'}"
+    }, 200
+
 @bp.route("/dev/toggle_user_status/<int:user_id>", methods=["POST"])
 def dev_toggle_user_status(user_id):
     """Development-only toggle user status (hide/show)."""
@@ -841,24 +1105,63 @@ def dev_toggle_user_status(user_id):
         abort(404)
     
     try:
-        user = db.session.query(users).filter(users.id == user_id).first()
-        if not user:
-            return jsonify({"success": False, "error": "User not found"}), 404
-        
-        # Toggle status
-        user.status = not user.status
-        db.session.commit()
-        
-        return jsonify({
-            "success": True, 
-            "status": user.status,
-            "message": f"User {'hidden' if not user.status else 'shown'}"
-        })
-        
+        return _run_admin_op(_toggle_user_status, user_id)
     except Exception as e:
         db.session.rollback()
         return jsonify({"success": False, "error": f"Failed to toggle user status: {str(e)}"}), 500
 
+def _delete_beverage(beverage_id, force_delete=False):
+    """Delete one beverage (and with force_delete its prices and consumptions); returns (payload, status)."""
+    beverage = beverages.query.get(beverage_id)
+    if not beverage:
+        return {"success": False, "error": "Beverage not found"}, 404
+    
+    beverage_name = beverage.name
+    beverage_category = beverage.category
+    
+    if force_delete:
+        # Delete all related data first; the DELETE rowcounts are the counts we report.
+        # Plain Core DELETEs keep the ORM out of it; the caller commits everything together.
+        consumption_count = db.session.execute(
+            delete(consumptions.__table__).where(consumptions.__table__.c.beverage_id == beverage_id)
+        ).rowcount
+        price_count = db.session.execute(
+            delete(beverage_prices.__table__).where(beverage_prices.__table__.c.beverage_id == beverage_id)
+        ).rowcount
+    else:
+        # Check if beverage has prices or consumptions; EXISTS stops at the first row,
+        # the exact counts are only needed for the warning dialog.
+        has_prices, has_consumptions = db.session.query(
+            select(beverage_prices.id).where(beverage_prices.beverage_id == beverage_id).exists(),
+            select(consumptions.id).where(consumptions.beverage_id == beverage_id).exists()
+        ).one()
+        if has_prices or has_consumptions:
+            price_count, consumption_count = db.session.query(
+                select(func.count(beverage_prices.id)).where(beverage_prices.beverage_id == beverage_id).scalar_subquery(),
+                select(func.count(consumptions.id)).where(consumptions.beverage_id == beverage_id).scalar_subquery()
+            ).one()
+            return {
+                "success": False, 
+                "error": f"Cannot delete '{beverage.name}' - it has {price_count} price(s) and {consumption_count} consumption(s).",
+                "has_related_data": True,
+                "price_count": price_count,
+                "consumption_count": consumption_count,
+                "beverage_name": beverage.name
+            }, 400
+    
+    # Delete the beverage itself
+    db.session.execute(delete(beverages.__table__).where(beverages.__table__.c.id == beverage_id))
+    mark_index_data_changed()
+    
+    message = f"{beverage_category.title()} '{beverage_name}' deleted successfully"
+    if force_delete and (price_count > 0 or consumption_count > 0):
+        message += f" (including {consumption_count} consumption(s) and {price_count} price(s))"
+    
+    return {
+        "success": True,
+        "message": message
+    }, 200
+
 @bp.route("/dev/delete_beverage/<int:beverage_id>", methods=["DELETE"])
 def dev_delete_beverage(beverage_id):
     """Development-only individual beverage deletion."""
@@ -867,14 +1170,6 @@ def dev_delete_beverage(beverage_id):
         abort(404)
     
     try:
-        beverage = beverages.query.get(beverage_id)
-        if not beverage:
-            return jsonify({"success": False, "error": "Beverage not found"}), 404
-        
-        # Check if beverage has prices or consumptions
-        price_count = beverage_prices.query.filter_by(beverage_id=beverage_id).count()
-        consumption_count = consumptions.query.filter_by(beverage_id=beverage_id).count()
-        
         # Get the force_delete parameter from request
         force_delete = False
         try:
@@ -885,46 +1180,65 @@ def dev_delete_beverage(beverage_id):
             # If JSON parsing fails, default to False
             force_delete = False
         
-        if (price_count > 0 or consumption_count > 0) and not force_delete:
-            return jsonify({
-                "success": False, 
-                "error": f"Cannot delete '{beverage.name}' - it has {price_count} price(s) and {consumption_count} consumption(s).",
-                "has_related_data": True,
-                "price_count": price_count,
-                "consumption_count": consumption_count,
-                "beverage_name": beverage.name
-            }), 400
-        
-        beverage_name = beverage.name
-        beverage_category = beverage.category
-        
-        # If force_delete is True, delete all related data first
-        if force_delete:
-            # Delete all consumptions for this beverage
-            if consumption_count > 0:
-                consumptions.query.filter_by(beverage_id=beverage_id).delete()
-            
-            # Delete all prices for this beverage
-            if price_count > 0:
-                beverage_prices.query.filter_by(beverage_id=beverage_id).delete()
-        
-        # Delete the beverage itself
-        beverages.query.filter_by(id=beverage_id).delete()
-        db.session.commit()
-        
-        message = f"{beverage_category.title()} '{beverage_name}' deleted successfully"
-        if force_delete and (price_count > 0 or consumption_count > 0):
-            message += f" (including {consumption_count} consumption(s) and {price_count} price(s))"
-        
-        return jsonify({
-            "success": True,
-            "message": message
-        })
-        
+        return _run_admin_op(_delete_beverage, beverage_id, force_delete)
     except Exception as e:
         db.session.rollback()
         return jsonify({"success": False, "error": f"Failed to delete beverage: {str(e)}"}), 500
 
+# Operations /dev/batch can run; each returns (payload, status) without committing
+_BATCH_OPS = {
+    'toggle_user_status': _toggle_user_status,
+    'delete_user': _delete_user,
+    'delete_beverage': _delete_beverage,
+}
+BATCH_MAX_REQUESTS = 100
+
+def _run_admin_op(op, *args):
+    """Run a single admin operation as its own request: commit on success, roll back otherwise."""
+    payload, status = op(*args)
+    if status < 400:
+        db.session.commit()
+    else:
+        db.session.rollback()
+    return jsonify(payload), status
+
+@bp.route("/dev/batch", methods=["POST"])
+def dev_batch():
+    """Development-only: run several admin operations in one request and one transaction.
+    Body: {"requests": [{"op": "toggle_user_status", "args": {"user_id": 3}}, ...]}.
+    All operations commit together; the first failure rolls everything back.
+    """
+    if not is_admin_mode():
+        abort(404)
+    
+    batch = (request.get_json(silent=True) or {}).get('requests')
+    if not isinstance(batch, list) or not batch:
+        return jsonify({"success": False, "error": "requests must be a non-empty list"}), 400
+    if len(batch) > BATCH_MAX_REQUESTS:
+        return jsonify({"success": False, "error": f"At most {BATCH_MAX_REQUESTS} requests per batch"}), 400
+    
+    results = []
+    try:
+        for index, item in enumerate(batch):
+            item = item if isinstance(item, dict) else {}
+            op = _BATCH_OPS.get(item.get('op'))
+            if op is None:
+                payload, status = {"success": False, "error": f"Unknown op: {item.get('op')!r}"}, 400
+            else:
+                try:
+                    payload, status = op(**(item.get('args') or {}))
+                except TypeError as e:
+                    payload, status = {"success": False, "error": f"Invalid args: {e}"}, 400
+            results.append({"id": item.get('id', index), "status": status, "body": payload})
+            if status >= 400:
+                db.session.rollback()
+                return jsonify({"success": False, "failed_index": index, "results": results}), status
+        db.session.commit()
+        return jsonify({"success": True, "results": results})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": f"Batch failed: {str(e)}", "results": results}), 500
+
 @bp.route("/dev/delete_data", methods=["POST"])
 def dev_delete_data():
     """Development-only data deletion."""
@@ -944,78 +1258,70 @@ def dev_delete_data():
         # Delete in correct order to handle foreign key constraints
         # Order: payment_consumptions -> consumptions -> beverage_prices -> beverages -> invoices -> users -> roles
         
+        # Bulk DELETEs report their own rowcount, so no COUNT(*) runs beforehand, and
+        # synchronize_session=False skips matching the deleted rows against the session
+        def bulk_delete(model):
+            return model.query.delete(synchronize_session=False)
+
         if "consumptions" in delete_types:
-            count = consumptions.query.count()
-            
             # Delete payment_consumptions first (foreign key constraint)
-            payment_consumptions_count = payment_consumptions.query.count()
+            payment_consumptions_count = bulk_delete(payment_consumptions)
             if payment_consumptions_count > 0:
-                payment_consumptions.query.delete()
                 deleted_items.append(f"{payment_consumptions_count} payment_consumption links")
             
             # Now delete consumptions
-            consumptions.query.delete()
+            count = bulk_delete(consumptions)
             deleted_items.append(f"{count} consumptions")
         
         if "prices" in delete_types:
-            count = beverage_prices.query.count()
-            beverage_prices.query.delete()
+            count = bulk_delete(beverage_prices)
             deleted_items.append(f"{count} prices")
         
         if "beverages" in delete_types:
-            count = beverages.query.count()
-            
             # Delete beverage_prices first (foreign key constraint)
             # Only if prices weren't already deleted
             if "prices" not in delete_types:
-                beverage_prices_count = beverage_prices.query.count()
+                beverage_prices_count = bulk_delete(beverage_prices)
                 if beverage_prices_count > 0:
-                    beverage_prices.query.delete()
                     deleted_items.append(f"{beverage_prices_count} beverage prices")
             
             # Now delete beverages
-            beverages.query.delete()
+            count = bulk_delete(beverages)
             deleted_items.append(f"{count} beverages/food")
         
         if "users" in delete_types:
-            count = users.query.count()
-            
             # Delete related data first (foreign key constraints)
             # Order: payment_consumptions -> mypos_transactions -> user_payments -> consumptions -> invoices -> users
             
             # Delete payment_consumptions first (references user_payments and consumptions)
             # Must delete ALL payment_consumptions, not just those linked to consumptions
-            payment_consumptions_count = payment_consumptions.query.count()
+            payment_consumptions_count = bulk_delete(payment_consumptions)
             if payment_consumptions_count > 0:
-                payment_consumptions.query.delete()
                 deleted_items.append(f"{payment_consumptions_count} payment_consumption links")
             
             # Delete mypos_transactions (references user_payments and users)
-            mypos_transactions_count = mypos_transactions.query.count()
+            mypos_transactions_count = bulk_delete(mypos_transactions)
             if mypos_transactions_count > 0:
-                mypos_transactions.query.delete()
                 deleted_items.append(f"{mypos_transactions_count} mypos transactions")
             
             # Delete user_payments (references users)
-            user_payments_count = user_payments.query.count()
+            user_payments_count = bulk_delete(user_payments)
             if user_payments_count > 0:
-                user_payments.query.delete()
                 deleted_items.append(f"{user_payments_count} user payments")
             
             # Delete consumptions (only if not already deleted)
             if "consumptions" not in delete_types:
-                consumptions.query.delete()
+                bulk_delete(consumptions)
             
             # Delete invoices
-            invoices.query.delete()
+            bulk_delete(invoices)
             
             # Now delete users
-            users.query.delete()
+            count = bulk_delete(users)
             deleted_items.append(f"{count} users")
         
         if "roles" in delete_types:
-            count = roles.query.count()
-            roles.query.delete()
+            count = bulk_delete(roles)
             deleted_items.append(f"{count} roles")
         
         db.session.commit()
@@ -1029,19 +1335,42 @@ def dev_delete_data():
         db.session.rollback()
         return jsonify({"success": False, "error": f"Failed to delete data: {str(e)}"}), 500
 
+def _beverages_with_prices(role_id):
+    """Active beverages plus a {beverage_id: row} price lookup for one role, from a single LEFT JOIN."""
+    rows = db.session.query(
+        beverages.id,
+        beverages.name,
+        beverages.category,
+        beverage_prices.id.label('price_id'),
+        beverage_prices.price_cents
+    ).outerjoin(beverage_prices, and_(
+        beverage_prices.beverage_id == beverages.id,
+        beverage_prices.role_id == role_id
+    )).filter(beverages.status == True)\
+     .order_by(beverages.id).all()
+    price_lookup = {row.id: row for row in rows if row.price_cents is not None}
+    return rows, price_lookup
+
+def _entries_template_user(user):
+    """Plain copy of the user fields entries.html reads.
+    The page is streamed after the request's session is torn down, so the template
+    must not touch ORM attributes that could lazy-load or have been expired.
+    """
+    return {
+        'id': user.id,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'pin_hash': user.pin_hash,
+        'role_id': user.role_id,
+        'role': {'name': user.role.name} if user.role else None
+    }
+
 @bp.route("/guests")
 def guests():
     """Guest entry page - uses a persistent 'Guests' user (role Guests)."""
     guest_user = get_or_create_guest_user()
     
-    # Fetch all active beverages
-    all_beverages = beverages.query.filter_by(status=True).all()
-    
-    # Fetch beverage prices for the guest role
-    beverage_prices_for_role = beverage_prices.query.filter_by(role_id=guest_user.role_id).all()
-    
-    # Create a dictionary for easy price lookup
-    price_lookup = {bp.beverage_id: bp for bp in beverage_prices_for_role}
+    all_beverages, price_lookup = _beverages_with_prices(guest_user.role_id)
     
     # Convert guest user to dictionary for JSON serialization
     user_dict = {
@@ -1056,19 +1385,14 @@ def guests():
     }
     
     # Get current theme, color and version (for cache-busting)
-    theme = settings.get_value('theme', 'coffee') or 'coffee'
-    theme_colors = {
-        'coffee': '#222222',
-        'spring': '#4CAF50',
-        'summer': '#FF9800',
-        'autumn': '#FF5722',
-        'winter': '#2196F3'
-    }
-    theme_color = theme_colors.get(theme, '#222222')
-    theme_version = settings.get_value('theme_version', '1') or '1'
-    
-    response = make_response(render_template("entries.html", 
-                         user=guest_user,
+    current = page_settings()
+    theme = current['theme']
+    theme_color = THEME_COLORS.get(theme, '#222222')
+    theme_version = current['theme_version']
+    
+    # Streamed so the head and user header go out while the beverage grid renders
+    response = Response(stream_template("entries.html", 
+                         user=_entries_template_user(guest_user),
                          beverages=all_beverages,
                          price_lookup=price_lookup,
                          consumptions=[],
@@ -1076,7 +1400,7 @@ def guests():
                          theme=theme,
                          theme_color=theme_color,
                          theme_version=theme_version,
-                         payment_button_hidden=False))
+                         payment_button_hidden=False), mimetype='text/html')
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
@@ -1090,7 +1414,8 @@ def entries():
         # Redirect to index if no user_id provided
         return redirect(url_for('routes.index'))
 
-    user_record = users.query.get(user_id)
+    # The page and user_dict both read the role, so load it in the same query
+    user_record = db.session.get(users, user_id, options=[joinedload(users.role)])
     if not user_record:
         return redirect(url_for('routes.index'))
 
@@ -1113,12 +1438,26 @@ def entries():
         # PIN verification required for all users (backend security)
         if user_record.pin_hash:
             # User has PIN - check if PIN was verified
-            if not session.get(f'pin_verified_{user_id}', False):
+            if not is_pin_verified(user_id):
                 # PIN not verified - redirect to index with PIN requirement
                 return redirect(url_for('routes.index') + f'?user_id={user_id}&require_pin=true')
     
     user = user_record
     
+    # PIN-protected pages stay no-store so the kiosk's back button cannot reveal them.
+    # Other pages revalidate with an ETag: users_version changes with any user,
+    # consumption, beverage or price write, so a match means nothing shown here changed.
+    etag = None
+    if not user_record.pin_hash or is_admin_port():
+        current = page_settings()
+        etag = hashlib.blake2b(
+            f"{user_id}|{index_settings()['users_version']}|{current['theme_version']}|"
+            f"{current['payment_button_hidden']}|{is_admin_port()}|{date.today().isoformat()}".encode(),
+            digest_size=8
+        ).hexdigest()
+        if etag in request.if_none_match:
+            return _entries_revalidated(make_response('', 304), etag)
+    
     # Fetch user's beverage consumptions with counts per beverage (CURRENT MONTH ONLY)
     # Users should only see their current month consumption, not historical data
     current_month = date.today().replace(day=1)
@@ -1139,29 +1478,13 @@ def entries():
             'total_quantity': result.total_quantity
         })
     
-    # Fetch all active beverages
-    all_beverages = beverages.query.filter_by(status=True).all()
+    all_beverages, price_lookup = _beverages_with_prices(user.role_id)
     
-    # Fetch beverage prices for this user's role
-    beverage_prices_for_role = beverage_prices.query.filter_by(role_id=user.role_id).all()
-    
-    # Create a dictionary for easy price lookup
-    price_lookup = {bp.beverage_id: bp for bp in beverage_prices_for_role}
-    
-    # Calculate total amount owed for ALL time (not just current month)
-    # Get ALL consumptions for the user (no date filter)
-    all_consumption_results = db.session.query(
-        consumptions.beverage_id,
-        func.sum(consumptions.quantity).label('total_quantity')
-    ).filter_by(user_id=user_id)\
-     .group_by(consumptions.beverage_id).all()
-    
-    total_amount_cents = 0
-    for result in all_consumption_results:
-        # Get the price for this beverage and user's role
-        price_info = price_lookup.get(result.beverage_id)
-        if price_info:
-            total_amount_cents += result.total_quantity * price_info.price_cents
+    # Total amount owed for ALL time (not just current month), summed in the database
+    # from the price stored on each consumption
+    total_amount_cents = db.session.query(
+        func.coalesce(func.sum(consumptions.total_cost_cents), 0)
+    ).filter(consumptions.user_id == user_id).scalar()
     
     # Convert user to dictionary for JSON serialization
     user_dict = {
@@ -1170,31 +1493,26 @@ def entries():
         'last_name': user.last_name,
         'email': user.email,
         'role': {
-            'id': user.role.id,
+            'id': user.role_id,
             'name': user.role.name
         } if user.role else None
     }
     
     # Get current theme, color, and version (for cache busting)
-    theme = settings.get_value('theme', 'coffee') or 'coffee'
-    theme_colors = {
-        'coffee': '#222222',
-        'spring': '#4CAF50',
-        'summer': '#FF9800',
-        'autumn': '#FF5722',
-        'winter': '#2196F3'
-    }
-    theme_color = theme_colors.get(theme, '#222222')
-    theme_version = settings.get_value('theme_version', '1') or '1'
+    current = page_settings()
+    theme = current['theme']
+    theme_color = THEME_COLORS.get(theme, '#222222')
+    theme_version = current['theme_version']
     
     # Check if payment button should be hidden (always visible on admin port)
-    payment_button_hidden = settings.get_value('payment_button_hidden', 'false').lower() == 'true'
+    payment_button_hidden = current['payment_button_hidden'].lower() == 'true'
     if is_admin_port():
         payment_button_hidden = False
     
 
-    response = make_response(render_template("entries.html", 
-                         user=user, 
+    # Streamed so the head and user header go out while the beverage grid renders
+    response = Response(stream_template("entries.html", 
+                         user=_entries_template_user(user),
                          user_data=user_dict,
                          consumptions=user_consumptions,
                          beverages=all_beverages,
@@ -1203,12 +1521,20 @@ def entries():
                          theme=theme,
                          theme_color=theme_color,
                          theme_version=theme_version,
-                         payment_button_hidden=payment_button_hidden))
+                         payment_button_hidden=payment_button_hidden), mimetype='text/html')
+    if etag:
+        return _entries_revalidated(response, etag)
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
     return response
 
+def _entries_revalidated(response, etag):
+    """Let the browser keep an entries page but check its ETag on every use."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache, must-revalidate'
+    return response
+
 @bp.route("/verify_pin", methods=["POST"])
 def verify_pin_route():
     """Verify PIN for a specific user"""
@@ -1220,17 +1546,11 @@ def verify_pin_route():
         if not user_id or not pin:
             return jsonify({"error": "User ID and PIN are required"}), 400
 
-        user = users.query.get(user_id)
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-
-        if restore_pin_for_user(user):
-            db.session.commit()
-        
-        # Use existing verify_pin function
+        # No separate user lookup: verify_pin answers unknown users with the same 401
+        # and the same hashing work, so the response does not reveal which ids exist
         if verify_pin(user_id, pin):
             # Set session flag to indicate PIN was verified
-            session[f'pin_verified_{user_id}'] = True
+            mark_pin_verified(user_id)
             return jsonify({"success": True})
         else:
             return jsonify({"error": "Invalid PIN"}), 401
@@ -1319,78 +1639,65 @@ def add_consumption():
             return jsonify({"error": "No JSON data provided"}), 400
             
         try:
-            user_id_raw = data.get('user_id')
-            beverage_id_raw = data.get('beverage_id')
-            quantity_raw = data.get('quantity', 1)
-            
-            if user_id_raw is None or beverage_id_raw is None:
-                return jsonify({"error": "Missing required fields: user_id and beverage_id are required"}), 400
-                
-            user_id = int(user_id_raw)
-            beverage_id = int(beverage_id_raw)
-            quantity = int(quantity_raw)
-        except (ValueError, TypeError) as e:
+            user_id, beverage_id, quantity = _json_ints(data, 'user_id', 'beverage_id', quantity=1)
+        except KeyError as e:
+            return jsonify({"error": f"Missing required field: {e.args[0]}"}), 400
+        except ValueError as e:
             return jsonify({"error": f"Invalid data format: {str(e)}"}), 400
         
         # Validate required identifiers
         # Note: user_id can be 0 for guest users; do not treat 0 as missing
-        if beverage_id is None:
-            return jsonify({"error": "Missing required fields"}), 400
         if beverage_id <= 0:
             return jsonify({"error": "Invalid beverage_id"}), 400
         
-        # Handle guest users (user_id = 0)
+        # Handle guest users (user_id = 0): no users row, priced with role ID 1 (Guests role)
         if user_id == 0:
-            # Create a temporary guest user object
-            user = type('GuestUser', (), {
-                'id': 0,
-                'role_id': 1,  # Default to role ID 1 (Guests role)
-                'first_name': 'Guest',
-                'last_name': ''
-            })()
+            buyer = select(literal(0).label('user_id'), literal(1).label('role_id')).subquery()
         else:
-            # Validate regular user exists
-            user = users.query.get(user_id)
-            if not user:
-                return jsonify({"error": "User not found"}), 404
-        
-        # Validate beverage exists and is active
-        beverage = beverages.query.filter_by(id=beverage_id, status=True).first()
-        if not beverage:
-            return jsonify({"error": "Beverage not found or inactive"}), 404
-        
-        # Get beverage price for user's role
-        beverage_price = beverage_prices.query.filter_by(
-            role_id=user.role_id,
-            beverage_id=beverage_id
+            buyer = select(users.id.label('user_id'), users.role_id).where(users.id == user_id).subquery()
+        
+        # Validate user, active beverage and the role's price in one round trip
+        lookup = db.session.execute(
+            select(buyer.c.user_id, beverages.id.label('beverage_id'),
+                   beverage_prices.id.label('price_id'), beverage_prices.price_cents)
+            .select_from(buyer)
+            .outerjoin(beverages, and_(beverages.id == beverage_id, beverages.status == True))
+            .outerjoin(beverage_prices, and_(
+                beverage_prices.role_id == buyer.c.role_id,
+                beverage_prices.beverage_id == beverages.id
+            ))
         ).first()
-        
-        if not beverage_price:
+        if lookup is None:
+            return jsonify({"error": "User not found"}), 404
+        if lookup.beverage_id is None:
+            return jsonify({"error": "Beverage not found or inactive"}), 404
+        if lookup.price_id is None:
             return jsonify({"error": "No price found for this beverage and role"}), 404
         
-        # Get or create monthly invoice (skip for guest users with id 0)
-        invoice = None
+        # Get or create monthly invoice (skip for guest users with id 0); a new invoice is
+        # only flushed so it commits together with the consumption below
+        invoice_id = None
         if user_id != 0:
-            invoice = check_invoice_exists(user_id)
+            invoice_id = check_invoice_exists(user_id, commit=False).id
         
         # Create consumption entry
-        consumption = consumptions(
-            user_id=user_id,
-            beverage_id=beverage_id,
-            beverage_price_id=beverage_price.id,
-            invoice_id=(invoice.id if invoice else None),
-            quantity=quantity,
-            unit_price_cents=beverage_price.price_cents
-        )
-        
-        db.session.add(consumption)
+        consumption_id = db.session.execute(
+            insert(consumptions).values(
+                user_id=user_id,
+                beverage_id=beverage_id,
+                beverage_price_id=lookup.price_id,
+                invoice_id=invoice_id,
+                quantity=quantity,
+                unit_price_cents=lookup.price_cents
+            ).returning(consumptions.id)
+        ).scalar()
         db.session.commit()
         
         return jsonify({
             "success": True,
             "message": "Consumption added successfully",
-            "consumption_id": consumption.id,
-            "invoice_id": invoice.id
+            "consumption_id": consumption_id,
+            "invoice_id": invoice_id
         })
         
     except ValueError as e:
@@ -1419,12 +1726,7 @@ def dev_consumptions_manage():
         try:
             if action == 'clear_all':
                 # Clear all consumptions for the user in selected month (or current month if not provided)
-                if year and month:
-                    target_start = date(int(year), int(month), 1)
-                    target_end = date(int(year) + (1 if int(month) == 12 else 0), (1 if int(month) == 12 else int(month)+1), 1)
-                else:
-                    target_start = date.today().replace(day=1)
-                    target_end = (target_start.replace(month=1, year=target_start.year+1) if target_start.month == 12 else target_start.replace(month=target_start.month+1))
+                target_start, target_end = _selected_month_range(year, month)
                 consumptions.query.filter(
                     consumptions.user_id == user_id,
                     consumptions.created_at >= target_start,
@@ -1438,12 +1740,7 @@ def dev_consumptions_manage():
                     return jsonify({"success": False, "error": "Beverage ID is required"}), 400
                 
                 # Clear all consumptions for specific beverage and user in selected month (or current)
-                if year and month:
-                    target_start = date(int(year), int(month), 1)
-                    target_end = date(int(year) + (1 if int(month) == 12 else 0), (1 if int(month) == 12 else int(month)+1), 1)
-                else:
-                    target_start = date.today().replace(day=1)
-                    target_end = (target_start.replace(month=1, year=target_start.year+1) if target_start.month == 12 else target_start.replace(month=target_start.month+1))
+                target_start, target_end = _selected_month_range(year, month)
                 consumptions.query.filter(
                     consumptions.user_id == user_id,
                     consumptions.beverage_id == beverage_id,
@@ -1467,31 +1764,20 @@ def dev_consumptions_manage():
                     return jsonify({"success": False, "error": "Invalid quantity format"}), 400
                 
                 # Get current total quantity for the beverage within selected month
-                if year and month:
-                    target_start = date(int(year), int(month), 1)
-                    target_end = date(int(year) + (1 if int(month) == 12 else 0), (1 if int(month) == 12 else int(month)+1), 1)
-                else:
-                    target_start = date.today().replace(day=1)
-                    target_end = (target_start.replace(month=1, year=target_start.year+1) if target_start.month == 12 else target_start.replace(month=target_start.month+1))
-                current_consumptions = consumptions.query.filter(
+                target_start, target_end = _selected_month_range(year, month)
+                in_month = consumptions.query.filter(
                     consumptions.user_id == user_id,
                     consumptions.beverage_id == beverage_id,
                     consumptions.created_at >= target_start,
                     consumptions.created_at < target_end
-                ).all()
-                
-                current_total = sum(c.quantity for c in current_consumptions)
+                )
+                current_total = in_month.with_entities(func.coalesce(func.sum(consumptions.quantity), 0)).scalar()
                 
                 if new_quantity == current_total:
                     return jsonify({"success": True, "message": "Quantity unchanged"})
                 
-                # Clear existing consumptions
-                for cons in current_consumptions:
-                    db.session.delete(cons)
-                
-                # Add new consumption with adjusted quantity
                 if new_quantity > 0:
-                    # Get beverage price for user's role
+                    # Get beverage price for user's role (before anything is deleted)
                     user = users.query.get(user_id)
                     beverage_price = beverage_prices.query.filter_by(
                         role_id=user.role_id,
@@ -1500,82 +1786,99 @@ def dev_consumptions_manage():
                     
                     if not beverage_price:
                         return jsonify({"success": False, "error": "No price found for this beverage and role"}), 404
-                    
+                
+                # Clear existing consumptions in one statement
+                in_month.delete(synchronize_session=False)
+                
+                # Add new consumption with adjusted quantity
+                if new_quantity > 0:
                     # Get or create invoice for the selected month
-                    invoice = check_invoice_exists(user_id, period=target_start)
+                    invoice = check_invoice_exists(user_id, period=target_start, commit=False)
                     
                     # Create new consumption with adjusted quantity
-                    new_consumption = consumptions(
+                    db.session.execute(insert(consumptions).values(
                         user_id=user_id,
                         beverage_id=beverage_id,
                         beverage_price_id=beverage_price.id,
                         invoice_id=invoice.id,
                         quantity=new_quantity,
                         unit_price_cents=beverage_price.price_cents
-                    )
-                    db.session.add(new_consumption)
+                    ))
                 
                 db.session.commit()
                 return jsonify({"success": True, "message": f"Quantity adjusted to {new_quantity}"})
             elif action == 'add_backdated':
-                # Admin-only: add consumptions for a specific month
-                beverage_id = data.get('beverage_id')
-                quantity = data.get('quantity')
-                year = data.get('year')
-                month = data.get('month')
-
-                if not all([beverage_id, quantity, year, month]):
-                    return jsonify({"success": False, "error": "beverage_id, quantity, year and month are required"}), 400
-
-                try:
-                    beverage_id = int(beverage_id)
-                    quantity = int(quantity)
-                    year = int(year)
-                    month = int(month)
+                # Admin-only: add consumptions for specific months. Either one row given by the
+                # top-level fields, or a batch as items: [{beverage_id, quantity, year, month}, ...]
+                items = data.get('items')
+                if items is None:
+                    items = [data]
+                if not isinstance(items, list) or not items:
+                    return jsonify({"success": False, "error": "items must be a non-empty list"}), 400
+
+                parsed = []
+                for item in items:
+                    if not isinstance(item, dict) or not all(item.get(k) for k in ('beverage_id', 'quantity', 'year', 'month')):
+                        return jsonify({"success": False, "error": "beverage_id, quantity, year and month are required"}), 400
+                    try:
+                        beverage_id, quantity, year, month = map(int, (item['beverage_id'], item['quantity'], item['year'], item['month']))
+                    except (TypeError, ValueError):
+                        return jsonify({"success": False, "error": "Invalid numeric values"}), 400
                     if quantity <= 0:
                         return jsonify({"success": False, "error": "Quantity must be positive"}), 400
                     # Clamp to 1..12
-                    if month < 1 or month > 12:
+                    if not 1 <= month <= 12:
                         return jsonify({"success": False, "error": "Invalid month"}), 400
-                except (TypeError, ValueError):
-                    return jsonify({"success": False, "error": "Invalid numeric values"}), 400
+                    parsed.append((beverage_id, quantity, year, month))
 
                 try:
-                    # Validate user and beverage
-                    user = users.query.get(user_id)
-                    if not user:
+                    # Validate the user and the (active) beverages and fetch the user's role prices
+                    # in one query; the outer joins keep a row for an existing user either way
+                    beverage_ids = {beverage_id for beverage_id, _, _, _ in parsed}
+                    lookup = db.session.execute(
+                        select(beverages.id.label('beverage_id'), beverage_prices.id, beverage_prices.price_cents)
+                        .select_from(users)
+                        .outerjoin(beverages, and_(beverages.id.in_(beverage_ids), beverages.status == True))
+                        .outerjoin(beverage_prices, and_(
+                            beverage_prices.role_id == users.role_id,
+                            beverage_prices.beverage_id == beverages.id
+                        ))
+                        .where(users.id == user_id)
+                    ).all()
+                    if not lookup:
                         return jsonify({"success": False, "error": "User not found"}), 404
-                    beverage = beverages.query.filter_by(id=beverage_id, status=True).first()
-                    if not beverage:
+                    if beverage_ids - {row.beverage_id for row in lookup}:
                         return jsonify({"success": False, "error": "Beverage not found or inactive"}), 404
-
-                    # Price for user's role
-                    price_row = beverage_prices.query.filter_by(role_id=user.role_id, beverage_id=beverage_id).first()
-                    if not price_row:
+                    price_rows = {row.beverage_id: row for row in lookup if row.id is not None}
+                    if beverage_ids - price_rows.keys():
                         return jsonify({"success": False, "error": "No price found for this beverage and role"}), 404
 
-                    # Target period (first day of selected month)
-                    target_period = date(year, month, 1)
-
-                    # Get or create invoice for that month
-                    invoice = check_invoice_exists(user_id, period=target_period)
-
-                    # Choose a created_at inside that month (use first day at noon)
-                    created_at_dt = datetime(year, month, 1, 12, 0, 0)
-
-                    # Create consumption row with given quantity
-                    new_cons = consumptions(
-                        user_id=user_id,
-                        beverage_id=beverage_id,
-                        beverage_price_id=price_row.id,
-                        invoice_id=invoice.id,
-                        quantity=quantity,
-                        unit_price_cents=price_row.price_cents,
-                        created_at=created_at_dt
-                    )
-                    db.session.add(new_cons)
+                    # Get or create the invoice of each target month once
+                    invoice_ids = {}
+                    rows = []
+                    for beverage_id, quantity, year, month in parsed:
+                        target_period = date(year, month, 1)
+                        if target_period not in invoice_ids:
+                            invoice_ids[target_period] = check_invoice_exists(user_id, period=target_period, commit=False).id
+                        price_row = price_rows[beverage_id]
+                        rows.append({
+                            'user_id': user_id,
+                            'beverage_id': beverage_id,
+                            'beverage_price_id': price_row.id,
+                            'invoice_id': invoice_ids[target_period],
+                            'quantity': quantity,
+                            'unit_price_cents': price_row.price_cents,
+                            # Choose a created_at inside that month (use first day at noon)
+                            'created_at': datetime(year, month, 1, 12, 0, 0)
+                        })
+
+                    # One executemany INSERT and one commit for the whole batch
+                    db.session.execute(insert(consumptions), rows)
                     db.session.commit()
-                    return jsonify({"success": True, "message": f"Added {quantity} consumption(s) to {target_period.strftime('%Y-%m')}"})
+                    if len(parsed) == 1:
+                        _, quantity, year, month = parsed[0]
+                        return jsonify({"success": True, "message": f"Added {quantity} consumption(s) to {date(year, month, 1).strftime('%Y-%m')}"})
+                    return jsonify({"success": True, "message": f"Added {len(rows)} backdated consumption rows"})
                 except Exception as e:
                     db.session.rollback()
                     return jsonify({"success": False, "error": f"Failed to add backdated consumption: {str(e)}"}), 500
@@ -1583,10 +1886,13 @@ def dev_consumptions_manage():
                 cons_id = data.get('consumption_id')
                 if not cons_id:
                     return jsonify({"success": False, "error": "consumption_id is required"}), 400
-                row = consumptions.query.filter_by(id=cons_id, user_id=user_id).first()
-                if not row:
+                # Delete straight away; the rowcount tells whether the row existed for this user
+                deleted = db.session.execute(
+                    delete(consumptions).where(consumptions.id == cons_id, consumptions.user_id == user_id),
+                    execution_options={'synchronize_session': False}
+                ).rowcount
+                if not deleted:
                     return jsonify({"success": False, "error": "Consumption not found"}), 404
-                db.session.delete(row)
                 db.session.commit()
                 return jsonify({"success": True, "message": "Consumption deleted"})
             else:
@@ -1604,50 +1910,58 @@ def dev_consumptions_manage():
         return jsonify({"success": False, "error": "User ID is required"}), 400
     
     try:
-        if year and month:
-            target_start = date(year, month, 1)
-            target_end = date(year + (1 if month == 12 else 0), (1 if month == 12 else month+1), 1)
-        else:
-            target_start = date.today().replace(day=1)
-            target_end = (target_start.replace(month=1, year=target_start.year+1) if target_start.month == 12 else target_start.replace(month=target_start.month+1))
-        user_consumptions = db.session.query(
-            consumptions,
-            beverages.name.label('beverage_name'),
-            beverages.category
-        ).join(beverages, consumptions.beverage_id == beverages.id) \
-         .filter(
-             consumptions.user_id == user_id,
-             consumptions.created_at >= target_start,
-             consumptions.created_at < target_end
-         ).order_by(consumptions.created_at.desc()).all()
-        
-        # Group by beverage
-        beverage_totals = {}
-        for cons, beverage_name, category in user_consumptions:
-            if beverage_name not in beverage_totals:
-                beverage_totals[beverage_name] = {
-                    'beverage_id': cons.beverage_id,
-                    'beverage_name': beverage_name,
-                    'category': category,
-                    'total_quantity': 0,
-                    'consumptions': []
-                }
-            beverage_totals[beverage_name]['total_quantity'] += cons.quantity
-            beverage_totals[beverage_name]['consumptions'].append({
-                'id': cons.id,
-                'quantity': cons.quantity,
-                'created_at': cons.created_at.isoformat()
-            })
+        target_start, target_end = _selected_month_range(year, month)
+        # One row per beverage, totals and the JSON list of its consumptions built by the database
+        beverage_totals = db.session.execute(
+            _user_month_consumptions_stmt(user_id, target_start, target_end)
+        ).mappings().all()
         
-        return jsonify({
+        return fast_json({
             "success": True,
-            "consumptions": list(beverage_totals.values()),
+            "consumptions": [dict(row) for row in beverage_totals],
             "period": {"year": (year or target_start.year), "month": (month or target_start.month)}
         })
         
     except Exception as e:
         return jsonify({"success": False, "error": f"Failed to fetch consumptions: {str(e)}"}), 500
 
+def _iso_timestamp(expr):
+    """Format a timestamp expression as an ISO-8601 string inside the database (NULL stays NULL)."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return func.to_char(expr, 'YYYY-MM-DD"T"HH24:MI:SS')
+    return func.strftime('%Y-%m-%dT%H:%M:%S', expr)
+
+def _user_month_consumptions_stmt(user_id, start, end):
+    """Per-beverage totals of a user's consumptions in [start, end), most recently consumed first.
+    Each row carries its consumptions (newest first) as a JSON list of {id, quantity, created_at}.
+    """
+    rows = select(
+        consumptions.id,
+        consumptions.beverage_id,
+        consumptions.quantity,
+        consumptions.created_at
+    ).where(
+        consumptions.user_id == user_id,
+        consumptions.created_at >= start,
+        consumptions.created_at < end
+    ).order_by(consumptions.created_at.desc()).subquery()
+    if db.session.get_bind().dialect.name == 'postgresql':
+        item = func.json_build_object('id', rows.c.id, 'quantity', rows.c.quantity, 'created_at', _iso_timestamp(rows.c.created_at))
+        items = func.json_agg(aggregate_order_by(item, rows.c.created_at.desc()))
+    else:
+        # SQLite aggregates in the order of the (ordered) subquery rows
+        item = func.json_object('id', rows.c.id, 'quantity', rows.c.quantity, 'created_at', _iso_timestamp(rows.c.created_at))
+        items = func.json_group_array(item)
+    return select(
+        rows.c.beverage_id,
+        beverages.name.label('beverage_name'),
+        beverages.category,
+        func.sum(rows.c.quantity).label('total_quantity'),
+        type_coerce(items, JSON).label('consumptions')
+    ).join(beverages, beverages.id == rows.c.beverage_id)\
+     .group_by(rows.c.beverage_id, beverages.name, beverages.category)\
+     .order_by(func.max(rows.c.created_at).desc())
+
 @bp.route("/admin_consumption_history")
 def admin_consumption_history():
     """Admin-only route to view historical consumption data for a specific user."""
@@ -1660,30 +1974,162 @@ def admin_consumption_history():
         return jsonify({"error": "User ID required"}), 400
     
     # Get all historical consumption for this user (no date filter)
+    # Timestamps are formatted by the database so rows are JSON-ready as returned
     consumption_results = db.session.query(
         consumptions.beverage_id,
         func.count(consumptions.id).label('count'),
         func.sum(consumptions.quantity).label('total_quantity'),
-        func.min(consumptions.created_at).label('first_consumption'),
-        func.max(consumptions.created_at).label('last_consumption')
+        _iso_timestamp(func.min(consumptions.created_at)).label('first_consumption'),
+        _iso_timestamp(func.max(consumptions.created_at)).label('last_consumption')
     ).filter_by(user_id=user_id).group_by(consumptions.beverage_id).all()
     
     # Convert to list of dictionaries for JSON serialization
-    historical_consumptions = []
-    for result in consumption_results:
-        historical_consumptions.append({
+    historical_consumptions = [
+        {
             'beverage_id': result.beverage_id,
             'count': result.count,
             'total_quantity': result.total_quantity,
-            'first_consumption': result.first_consumption.isoformat() if result.first_consumption else None,
-            'last_consumption': result.last_consumption.isoformat() if result.last_consumption else None
-        })
+            'first_consumption': result.first_consumption,
+            'last_consumption': result.last_consumption
+        } for result in consumption_results
+    ]
     
-    return jsonify({
+    return fast_json({
         "user_id": user_id,
         "historical_consumptions": historical_consumptions
     })
 
+def _next_month(d: date) -> date:
+    """First day of the month following d."""
+    return date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+def _selected_month_range(year, month) -> tuple[date, date]:
+    """[start, end) of the given month, or of the current month when either part is missing."""
+    start = date(int(year), int(month), 1) if year and month else date.today().replace(day=1)
+    return start, _next_month(start)
+
+REPORT_PAGE_SIZE = 100
+
+def _report_page_url(page: int) -> str:
+    """URL of the current monthly report with a different detail-table page."""
+    args = request.args.to_dict()
+    args['page'] = page
+    return url_for('routes.monthly_report', **args)
+
+class _ReportPage:
+    """At most page_size fetched rows; has_next is True when the extra look-ahead row came back."""
+
+    def __init__(self, rows, page_size: int):
+        self._rows = rows[:page_size]
+        self.has_next = len(rows) > page_size
+
+    def __iter__(self):
+        return iter(self._rows)
+
+# Monthly report statements, built once and executed with :start/:end bind parameters
+# so every request reuses the same SQLAlchemy compiled-cache entry.
+_report_period = and_(
+    consumptions.created_at >= bindparam('start'),
+    consumptions.created_at < bindparam('end')
+)
+
+_REPORT_FINGERPRINT_STMT = select(
+    func.count(consumptions.id),
+    func.max(consumptions.id)
+).where(_report_period)
+
+# Only columns the detail table renders; grouping by the two primary keys is enough
+# because every other selected column depends on them.
+_REPORT_DETAIL_STMT = select(
+    (users.first_name + ' ' + users.last_name).label('name'),
+    users.email,
+    beverages.name.label('beverage_name'),
+    beverages.category,
+    func.sum(consumptions.quantity).label('total_quantity'),
+    func.count(consumptions.id).label('consumption_count'),
+    func.sum(consumptions.total_cost_cents).label('total_cost_cents'),
+    func.avg(consumptions.unit_price_cents).label('avg_price_cents')
+).join(consumptions, users.id == consumptions.user_id)\
+ .join(beverages, consumptions.beverage_id == beverages.id)\
+ .where(_report_period)\
+ .group_by(users.id, beverages.id)\
+ .order_by(users.last_name, users.first_name, beverages.name, users.id, beverages.id)\
+ .limit(bindparam('limit'))\
+ .offset(bindparam('offset'))
+
+# Per-user and per-day totals come from one statement over a shared CTE, so the
+# period's consumptions are scanned once; the overall summary is summed in Python.
+_report_base = select(
+    consumptions.user_id,
+    consumptions.quantity,
+    consumptions.total_cost_cents,
+    func.date(consumptions.created_at).label('day')
+).where(_report_period).cte('report_base')
+
+_report_user_totals = select(
+    literal_column("'user'").label('kind'),
+    users.id,
+    users.first_name,
+    users.last_name,
+    users.email,
+    users.role_id,
+    cast(null(), Date).label('day'),
+    func.sum(_report_base.c.quantity).label('total_quantity'),
+    func.count().label('total_consumptions'),
+    func.sum(_report_base.c.total_cost_cents).label('total_cost_cents')
+).select_from(users)\
+ .join(_report_base, users.id == _report_base.c.user_id)\
+ .group_by(users.id, users.first_name, users.last_name, users.email, users.role_id)
+
+_report_day_totals = select(
+    literal_column("'day'").label('kind'),
+    null(), null(), null(), null(), null(),
+    _report_base.c.day,
+    func.sum(_report_base.c.quantity),
+    func.count(),
+    func.sum(_report_base.c.total_cost_cents)
+).group_by(_report_base.c.day)
+
+_REPORT_TOTALS_STMT = _report_user_totals.order_by(func.sum(_report_base.c.total_cost_cents).desc())
+
+# Date-range reports also get the daily breakdown: user rows first (by cost), then days in order
+_report_totals_with_days = union_all(_report_user_totals, _report_day_totals)
+_REPORT_TOTALS_DAILY_STMT = _report_totals_with_days.order_by(
+    _report_totals_with_days.selected_columns.kind.desc(),
+    _report_totals_with_days.selected_columns.day,
+    _report_totals_with_days.selected_columns.total_cost_cents.desc()
+)
+
+AVAILABLE_MONTHS_CACHE_SECONDS = 300
+
+# Rows emptied by deletes linger with a zero total, so they are skipped
+_AVAILABLE_MONTHS_STMT = select(user_month_consumption.period)\
+    .where(user_month_consumption.total != 0)\
+    .distinct()\
+    .order_by(user_month_consumption.period.desc())
+
+def _available_report_months():
+    """Distinct (year, month) pairs with consumptions, newest first; cached briefly."""
+    cache_key = 'monthly_report:available_months'
+    try:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+    except Exception as e:
+        # If cache fails, just continue without caching
+        print(f"WARNING: Cache get failed, continuing without cache: {e}")
+    # Months come from the trigger-maintained rollup (a few rows per user and month)
+    # instead of extracting year/month from every consumption row
+    periods = db.session.execute(_AVAILABLE_MONTHS_STMT).scalars().all()
+    # Plain ints so the list pickles cleanly into Redis and compares with the selected month
+    months = [{'year': period.year, 'month': period.month} for period in periods]
+    try:
+        cache.set(cache_key, months, timeout=AVAILABLE_MONTHS_CACHE_SECONDS)
+    except Exception as e:
+        # If cache set fails, just continue without caching
+        print(f"WARNING: Cache set failed, continuing without cache: {e}")
+    return months
+
 @bp.route("/monthly_report")
 def monthly_report():
     """Monthly consumption report for all users with optional date range."""
@@ -1698,8 +2144,8 @@ def monthly_report():
     # If date range is provided, use it; otherwise use month/year
     if start_date_str and end_date_str:
         try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            start_date = date.fromisoformat(start_date_str)
+            end_date = date.fromisoformat(end_date_str)
             report_date = start_date
             use_date_range = True
         except ValueError:
@@ -1708,7 +2154,7 @@ def monthly_report():
             month = request.args.get('month', date.today().month, type=int)
             report_date = date(year, month, 1)
             start_date = report_date
-            end_date = date(year, month + 1, 1) if month < 12 else date(year + 1, 1, 1)
+            end_date = _next_month(report_date)
             use_date_range = False
     else:
         # Use month/year selection
@@ -1716,100 +2162,65 @@ def monthly_report():
         month = request.args.get('month', date.today().month, type=int)
         report_date = date(year, month, 1)
         start_date = report_date
-        end_date = date(year, month + 1, 1) if month < 12 else date(year + 1, 1, 1)
+        end_date = _next_month(report_date)
         use_date_range = False
     
-    # Get all consumptions for the selected period
-    month_consumptions = db.session.query(
-        users.first_name,
-        users.last_name,
-        users.email,
-        roles.name.label('role_name'),
-        beverages.name.label('beverage_name'),
-        beverages.category,
-        func.sum(consumptions.quantity).label('total_quantity'),
-        func.count(consumptions.id).label('consumption_count'),
-        func.sum(consumptions.quantity * consumptions.unit_price_cents).label('total_cost_cents'),
-        func.avg(consumptions.unit_price_cents).label('avg_price_cents')
-    ).join(roles, users.role_id == roles.id)\
-     .join(consumptions, users.id == consumptions.user_id)\
-     .join(beverages, consumptions.beverage_id == beverages.id)\
-     .filter(
-         consumptions.created_at >= start_date,
-         consumptions.created_at < end_date
-     )\
-     .group_by(users.id, users.first_name, users.last_name, users.email, roles.name, beverages.id, beverages.name, beverages.category)\
-     .order_by(users.last_name, users.first_name, beverages.name)\
-     .all()
-    
-    # Get summary statistics
-    summary_stats = db.session.query(
-        func.count(func.distinct(users.id)).label('total_users'),
-        func.count(consumptions.id).label('total_consumptions'),
-        func.sum(consumptions.quantity).label('total_quantity'),
-        func.sum(consumptions.quantity * consumptions.unit_price_cents).label('total_revenue_cents')
-    ).join(consumptions, users.id == consumptions.user_id)\
-     .filter(
-         consumptions.created_at >= start_date,
-         consumptions.created_at < end_date
-     )\
-     .first()
+    # Detail table is paginated; summaries below stay unpaginated
+    page = max(request.args.get('page', 1, type=int), 1)
+    page_size = min(max(request.args.get('page_size', REPORT_PAGE_SIZE, type=int), 1), 1000)
+
+    # Get current theme and theme color
+    theme = current_theme()
+    theme_color = THEME_COLORS.get(theme, '#222222')
+
+    # Report statements are prebuilt at import (see _REPORT_*_STMT); only parameters vary
+    period = {'start': start_date, 'end': end_date}
+
+    # Cheap fingerprint of the period's rows so unchanged reports can be answered with 304.
+    # users_version changes with any user, role, beverage, price or consumption write, so
+    # renamed users, beverages or roles also produce a new ETag.
+    # Browsers always revalidate, so a changed name shows up on the next load.
+    row_count, max_id = db.session.execute(_REPORT_FINGERPRINT_STMT, period).first()
+    etag = hashlib.md5(
+        f"{start_date}|{end_date}|{row_count}|{max_id}|{index_settings()['users_version']}|"
+        f"{theme}|{request.query_string.decode()}".encode()
+    ).hexdigest()
+    cache_control = 'private, no-cache'
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    # Fetch one page of consumptions for the selected period (at most 1001 rows) before
+    # streaming: the streamed template runs after the request's session is torn down.
+    # One extra row is requested so the pager knows whether a next page exists.
+    month_consumptions = _ReportPage(
+        db.session.execute(
+            _REPORT_DETAIL_STMT,
+            {**period, 'limit': page_size + 1, 'offset': (page - 1) * page_size}
+        ).mappings().all(),
+        page_size
+    )
     
-    # Get user summaries (total per user)
-    user_summaries = db.session.query(
-        users.id,
-        users.first_name,
-        users.last_name,
-        users.email,
-        roles.name.label('role_name'),
-        func.sum(consumptions.quantity).label('total_quantity'),
-        func.count(consumptions.id).label('total_consumptions'),
-        func.sum(consumptions.quantity * consumptions.unit_price_cents).label('total_cost_cents')
-    ).join(roles, users.role_id == roles.id)\
-     .join(consumptions, users.id == consumptions.user_id)\
-     .filter(
-         consumptions.created_at >= start_date,
-         consumptions.created_at < end_date
-     )\
-     .group_by(users.id, users.first_name, users.last_name, users.email, roles.name)\
-     .order_by(func.sum(consumptions.quantity * consumptions.unit_price_cents).desc())\
-     .all()
+    # User summaries, daily statistics (date range only) and the overall summary in one round trip
+    totals = db.session.execute(
+        _REPORT_TOTALS_DAILY_STMT if use_date_range else _REPORT_TOTALS_STMT, period
+    ).all()
+    user_summaries = [row for row in totals if row.kind == 'user']
+    daily_stats = [row for row in totals if row.kind == 'day']
+    summary_stats = {
+        'total_users': len(user_summaries),
+        'total_consumptions': sum(row.total_consumptions for row in user_summaries),
+        'total_quantity': sum(row.total_quantity or 0 for row in user_summaries),
+        'total_revenue_cents': sum(row.total_cost_cents or 0 for row in user_summaries)
+    }
     
     # Get available months for navigation
-    available_months = db.session.query(
-        func.extract('year', consumptions.created_at).label('year'),
-        func.extract('month', consumptions.created_at).label('month')
-    ).distinct()\
-     .order_by(func.extract('year', consumptions.created_at).desc(), func.extract('month', consumptions.created_at).desc())\
-     .all()
-    
-    # Get daily statistics if using date range
-    daily_stats = []
-    if use_date_range:
-        daily_stats = db.session.query(
-            func.date(consumptions.created_at).label('date'),
-            func.count(consumptions.id).label('daily_consumptions'),
-            func.sum(consumptions.quantity).label('daily_quantity'),
-            func.sum(consumptions.quantity * consumptions.unit_price_cents).label('daily_revenue_cents')
-        ).filter(
-            consumptions.created_at >= start_date,
-            consumptions.created_at < end_date
-        ).group_by(func.date(consumptions.created_at))\
-         .order_by(func.date(consumptions.created_at))\
-         .all()
+    available_months = _available_report_months()
     
-    # Get current theme and theme color
-    theme = settings.get_value('theme', 'coffee') or 'coffee'
-    theme_colors = {
-        'coffee': '#222222',
-        'spring': '#4CAF50',
-        'summer': '#FF9800',
-        'autumn': '#FF5722',
-        'winter': '#2196F3'
-    }
-    theme_color = theme_colors.get(theme, '#222222')
-    
-    return render_template("monthly_report.html", 
+    # Streamed so the head and summaries go out while the detail table renders
+    response = Response(stream_template("monthly_report.html", 
                          consumptions=month_consumptions,
                          summary_stats=summary_stats,
                          user_summaries=user_summaries,
@@ -1821,8 +2232,14 @@ def monthly_report():
                          end_date=end_date,
                          use_date_range=use_date_range,
                          daily_stats=daily_stats,
+                         page=page,
+                         prev_page_url=_report_page_url(page - 1) if page > 1 else None,
+                         next_page_url=_report_page_url(page + 1),
                          theme=theme,
-                         theme_color=theme_color)
+                         theme_color=theme_color), mimetype='text/html')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
 
 # =============================================================================
 # CSV EXPORT AND BACKUP ROUTES
@@ -1985,8 +2402,8 @@ def export_detailed_backup():
     # Determine date range
     if start_date_str and end_date_str:
         try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            start_date = date.fromisoformat(start_date_str)
+            end_date = date.fromisoformat(end_date_str)
         except ValueError:
             return jsonify({"error": "Invalid date format"}), 400
     elif year and month:
@@ -2115,8 +2532,8 @@ def export_aggregated_report():
     # Determine date range
     if start_date_str and end_date_str:
         try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            start_date = date.fromisoformat(start_date_str)
+            end_date = date.fromisoformat(end_date_str)
             report_date = start_date
         except ValueError:
             return jsonify({"error": "Invalid date format"}), 400
@@ -2149,7 +2566,7 @@ def export_aggregated_report():
         beverages.category,
         func.sum(consumptions.quantity).label('total_quantity'),
         func.count(consumptions.id).label('consumption_count'),
-        func.sum(consumptions.quantity * consumptions.unit_price_cents).label('total_cost_cents'),
+        func.sum(consumptions.total_cost_cents).label('total_cost_cents'),
         func.avg(consumptions.unit_price_cents).label('avg_price_cents')
     ).join(roles, users.role_id == roles.id)\
      .join(consumptions, users.id == consumptions.user_id)\
@@ -2316,7 +2733,7 @@ def generate_monthly_backup():
         beverages.category,
         func.sum(consumptions.quantity).label('total_quantity'),
         func.count(consumptions.id).label('consumption_count'),
-        func.sum(consumptions.quantity * consumptions.unit_price_cents).label('total_cost_cents'),
+        func.sum(consumptions.total_cost_cents).label('total_cost_cents'),
         func.avg(consumptions.unit_price_cents).label('avg_price_cents')
     ).join(roles, users.role_id == roles.id)\
      .join(consumptions, users.id == consumptions.user_id)\
@@ -2464,13 +2881,14 @@ def restore_from_csv():
         # Get all users for matching - EXACT MATCH ONLY
         # Build user lookup with exact names only (case-insensitive for matching)
         all_users = {}
-        for u in users.query.all():
+        user_rows = users.query.all()
+        for u in user_rows:
             user_full_name = f"{u.first_name} {u.last_name}".strip()
             # Store with exact name and case-insensitive version for matching
             all_users[user_full_name] = u
             all_users[user_full_name.lower()] = u  # For case-insensitive lookup
         
-        print(f"Built user lookup with {len(users.query.all())} users (exact match only)")
+        print(f"Built user lookup with {len(user_rows)} users (exact match only)")
         
         # Build beverage lookup with multiple name variants for fuzzy matching
         all_beverages = {}
@@ -2740,15 +3158,7 @@ def restore_from_csv():
 @require_admin_only
 def admin_csv_restore():
     """CSV restore admin page"""
-    theme = settings.get_value('theme', 'coffee') or 'coffee'
-    theme_colors = {
-        'coffee': '#222222',
-        'spring': '#4CAF50',
-        'summer': '#FF9800',
-        'autumn': '#FF5722',
-        'winter': '#2196F3'
-    }
-    theme_color = theme_colors.get(theme, '#222222')
+    theme, theme_color = theme_bundle()
     
     return render_template("admin_csv_restore.html", theme=theme, theme_color=theme_color)
 
@@ -2859,6 +3269,28 @@ def admin_login():
     """Admin login page for backdoor access"""
     return render_template("admin_login.html")
 
+# User-agent fragments mapped to a friendly device name; first match wins
+_UA_PATTERNS = tuple((re.compile(pattern), name) for pattern, name in (
+    (r'Windows NT 10\.0', "Windows 10/11 PC"),
+    (r'Windows NT 6\.3', "Windows 8.1 PC"),
+    (r'Windows NT 6\.1', "Windows 7 PC"),
+    (r'Windows', "Windows PC"),
+    (r'Macintosh.*iPhone|iPhone.*Macintosh', "iPhone (Safari)"),
+    (r'Macintosh', "Mac (Safari)"),
+    (r'iPhone', "iPhone"),
+    (r'Android.*Mobile|Mobile.*Android', "Android Phone"),
+    (r'Android', "Android Tablet"),
+    (r'Linux', "Linux PC"),
+    (r'Chrome', "Chrome Browser"),
+    (r'Firefox', "Firefox Browser"),
+    (r'Safari', "Safari Browser"),
+    (r'Edge', "Edge Browser"),
+))
+
+def _detect_device(user_agent):
+    """Return a human-readable device name for the given User-Agent string"""
+    return next((name for pattern, name in _UA_PATTERNS if pattern.search(user_agent)), "Unknown Device")
+
 @bp.route("/admin/authenticate", methods=["POST"])
 def admin_authenticate():
     """Authenticate admin access"""
@@ -2870,54 +3302,22 @@ def admin_authenticate():
     user_agent = request.headers.get('User-Agent', 'unknown')
     
     # Enhanced device detection
-    device_name = "Unknown Device"
-    if 'Windows NT 10.0' in user_agent:
-        device_name = "Windows 10/11 PC"
-    elif 'Windows NT 6.3' in user_agent:
-        device_name = "Windows 8.1 PC"
-    elif 'Windows NT 6.1' in user_agent:
-        device_name = "Windows 7 PC"
-    elif 'Windows' in user_agent:
-        device_name = "Windows PC"
-    elif 'Macintosh' in user_agent:
-        if 'iPhone' in user_agent:
-            device_name = "iPhone (Safari)"
-        else:
-            device_name = "Mac (Safari)"
-    elif 'iPhone' in user_agent:
-        device_name = "iPhone"
-    elif 'Android' in user_agent:
-        if 'Mobile' in user_agent:
-            device_name = "Android Phone"
-        else:
-            device_name = "Android Tablet"
-    elif 'Linux' in user_agent:
-        device_name = "Linux PC"
-    elif 'Chrome' in user_agent:
-        device_name = "Chrome Browser"
-    elif 'Firefox' in user_agent:
-        device_name = "Firefox Browser"
-    elif 'Safari' in user_agent:
-        device_name = "Safari Browser"
-    elif 'Edge' in user_agent:
-        device_name = "Edge Browser"
+    device_name = _detect_device(user_agent)
     
     # Verify credentials securely
     success = verify_admin_credentials(username, password)
     
-    # Log the access attempt with smart password logging
-    from .models import admin_access_logs
+    # Log the access attempt with smart password logging (written in the background)
     password_to_log = "[HIDDEN]" if success else password  # Show wrong passwords, hide correct one
-    access_log = admin_access_logs(
-        ip_address=ip_address,
-        user_agent=user_agent,
-        device_name=device_name,
-        username_attempted=username,
-        password_attempted=password_to_log,
-        success=success
-    )
-    db.session.add(access_log)
-    db.session.commit()
+    access_log_queue.put({
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+        'device_name': device_name,
+        'username_attempted': username,
+        'password_attempted': password_to_log,
+        'success': success,
+        'created_at': datetime.utcnow()
+    })
     
     if success:
         session['admin_authenticated'] = True
@@ -2945,19 +3345,23 @@ def admin_access_logs_view():
     from .models import admin_access_logs
     from sqlalchemy import desc
     
-    # Get all access logs, ordered by most recent first
-    logs = admin_access_logs.query.order_by(desc(admin_access_logs.created_at)).limit(100).all()
+    # Get the latest access logs, most recent first. Only the columns the template
+    # renders are selected; the user agent is shown truncated to 100 characters,
+    # so fetch one extra character to keep the ellipsis check working.
+    logs = db.session.query(
+        admin_access_logs.id,
+        admin_access_logs.created_at,
+        admin_access_logs.ip_address,
+        admin_access_logs.device_name,
+        admin_access_logs.username_attempted,
+        admin_access_logs.password_attempted,
+        admin_access_logs.success,
+        func.substr(admin_access_logs.user_agent, 1, 101).label('user_agent')
+    ).order_by(desc(admin_access_logs.created_at)).limit(100).all()
     
     # Get current theme and theme color
-    theme = settings.get_value('theme', 'coffee') or 'coffee'
-    theme_colors = {
-        'coffee': '#222222',
-        'spring': '#4CAF50',
-        'summer': '#FF9800',
-        'autumn': '#FF5722',
-        'winter': '#2196F3'
-    }
-    theme_color = theme_colors.get(theme, '#222222')
+    theme = current_theme()
+    theme_color = THEME_COLORS.get(theme, '#222222')
     
     return render_template("admin_access_logs.html", logs=logs, theme=theme, theme_color=theme_color)
 
@@ -3014,15 +3418,7 @@ def admin_payments_view():
     payments_data = db.session.query(user_payments, users).join(users, user_payments.user_id == users.id).order_by(desc(user_payments.created_at)).all()
     
     # Get current theme and theme color
-    theme = settings.get_value('theme', 'coffee') or 'coffee'
-    theme_colors = {
-        'coffee': '#222222',
-        'spring': '#4CAF50',
-        'summer': '#FF9800',
-        'autumn': '#FF5722',
-        'winter': '#2196F3'
-    }
-    theme_color = theme_colors.get(theme, '#222222')
+    theme, theme_color = theme_bundle()
     
     return render_template("admin_payments.html", 
                          payments_data=payments_data, 
@@ -3035,7 +3431,13 @@ def admin_payments_view():
 # ADMIN: Cashbook
 # =============================================================================
 
-COMPANY_OPTIONS = ["Schülerfirma", "Pausenverkauf", "Kaffeemaschine"]
+COMPANY_OPTIONS = ("Schülerfirma", "Pausenverkauf", "Kaffeemaschine")
+_COMPANY_SET = frozenset(COMPANY_OPTIONS)
+
+def _validated_company(src):
+    """Company named in a request mapping (args/form), falling back to the first option."""
+    company = src.get('company')
+    return company if company in _COMPANY_SET else COMPANY_OPTIONS[0]
 
 @bp.route('/admin/cashbook/overview')
 def admin_cashbook_overview():
@@ -3044,62 +3446,58 @@ def admin_cashbook_overview():
     if not (is_admin_mode() or session.get('cashbook_authenticated', False)):
         return redirect(url_for('routes.index'))
     
-    from sqlalchemy import func
+    from sqlalchemy import case, func
     from datetime import datetime, timedelta
     
     # Get current theme
-    theme = settings.get_value('theme', 'coffee') or 'coffee'
-    theme_colors = {
-        'coffee': '#222222',
-        'spring': '#4CAF50',
-        'summer': '#FF9800',
-        'autumn': '#FF5722',
-        'winter': '#2196F3'
-    }
-    theme_color = theme_colors.get(theme, '#222222')
-    
-    # Get current user for display
-    current_user = session.get('cashbook_user', 'Admin')
+    theme, theme_color = theme_bundle()
     
     # Calculate date ranges
     today = datetime.now().date()
     week_ago = today - timedelta(days=7)
     month_ago = today - timedelta(days=30)
     
-    # Get summary statistics for each company
+    # Read-only view: skip autoflush checks before each query
+    with db.session.no_autoflush:
+        # Get summary statistics for all companies in one grouped pass
+        stats_rows = db.session.query(
+            cashbook_entries.company,
+            func.count(cashbook_entries.id),
+            func.sum(case((cashbook_entries.entry_date >= week_ago, 1), else_=0)),
+            func.sum(case((cashbook_entries.entry_date >= month_ago, 1), else_=0)),
+            func.sum(cashbook_entries.einnahmen_bar_cents),
+            func.sum(cashbook_entries.ausgaben_bar_cents)
+        ).filter(cashbook_entries.company.in_(COMPANY_OPTIONS))\
+         .group_by(cashbook_entries.company)\
+         .all()
+        stats_by_company = {row[0]: row[1:] for row in stats_rows}
+
+        # Last 10 entries per company in one windowed query; the newest row of each
+        # company also carries its current cash balance
+        ranked = db.session.query(
+            cashbook_entries,
+            func.row_number().over(
+                partition_by=cashbook_entries.company,
+                order_by=(cashbook_entries.entry_date.desc(), cashbook_entries.id.desc())
+            ).label('rn')
+        ).filter(cashbook_entries.company.in_(COMPANY_OPTIONS)).subquery()
+        ranked_entry = aliased(cashbook_entries, ranked)
+        recent_by_company = {company: [] for company in COMPANY_OPTIONS}
+        for entry in db.session.query(ranked_entry)\
+                .filter(ranked.c.rn <= 10)\
+                .order_by(ranked.c.company, ranked.c.rn):
+            recent_by_company[entry.company].append(entry)
+
     company_stats = {}
     for company in COMPANY_OPTIONS:
-        # Total entries
-        total_entries = cashbook_entries.query.filter_by(company=company).count()
-        
-        # Current cash balance
-        current_balance = get_current_kassenstand(company)
-        
-        # This week's activity
-        week_entries = cashbook_entries.query.filter(
-            cashbook_entries.company == company,
-            cashbook_entries.entry_date >= week_ago
-        ).count()
-        
-        # This month's activity
-        month_entries = cashbook_entries.query.filter(
-            cashbook_entries.company == company,
-            cashbook_entries.entry_date >= month_ago
-        ).count()
-        
-        # Total income and expenses
-        total_income = db.session.query(func.sum(cashbook_entries.einnahmen_bar_cents)).filter(
-            cashbook_entries.company == company
-        ).scalar() or 0
-        
-        total_expenses = db.session.query(func.sum(cashbook_entries.ausgaben_bar_cents)).filter(
-            cashbook_entries.company == company
-        ).scalar() or 0
-        
-        # Recent entries (last 10)
-        recent_entries = cashbook_entries.query.filter_by(company=company)\
-            .order_by(cashbook_entries.entry_date.desc(), cashbook_entries.id.desc())\
-            .limit(10).all()
+        total_entries, week_entries, month_entries, total_income, total_expenses = \
+            stats_by_company.get(company, (0, 0, 0, 0, 0))
+        week_entries = week_entries or 0
+        month_entries = month_entries or 0
+        total_income = total_income or 0
+        total_expenses = total_expenses or 0
+        recent_entries = recent_by_company[company]
+        current_balance = recent_entries[0].kassenstand_bar_cents if recent_entries else 0
         
         company_stats[company] = {
             'total_entries': total_entries,
@@ -3116,8 +3514,7 @@ def admin_cashbook_overview():
                            theme=theme,
                            theme_color=theme_color,
                            company_stats=company_stats,
-                           company_options=COMPANY_OPTIONS,
-                           current_user=current_user)
+                           company_options=COMPANY_OPTIONS)
 
 @bp.route('/admin/cashbook')
 def admin_cashbook():
@@ -3125,22 +3522,22 @@ def admin_cashbook():
     if not (is_admin_mode() or session.get('cashbook_authenticated', False)):
         return redirect(url_for('routes.index'))
     
-    company = request.args.get('company', COMPANY_OPTIONS[0])
-    if company not in COMPANY_OPTIONS:
-        company = COMPANY_OPTIONS[0]
-    entries = cashbook_entries.query.filter_by(company=company).order_by(cashbook_entries.entry_date.desc(), cashbook_entries.id.desc()).limit(200).all()
-    theme = settings.get_value('theme', 'coffee') or 'coffee'
-    theme_colors = {
-        'coffee': '#222222',
-        'spring': '#4CAF50',
-        'summer': '#FF9800',
-        'autumn': '#FF5722',
-        'winter': '#2196F3'
-    }
-    theme_color = theme_colors.get(theme, '#222222')
+    company = _validated_company(request.args)
+    # Fetch the latest entries together with the company's highest beleg number;
+    # the newest row already carries the current kassenstand
+    max_beleg = db.session.query(func.max(cashbook_entries.beleg_nummer))\
+        .filter(cashbook_entries.company == company)\
+        .scalar_subquery()
+    rows = db.session.query(cashbook_entries, max_beleg)\
+        .filter(cashbook_entries.company == company)\
+        .order_by(cashbook_entries.entry_date.desc(), cashbook_entries.id.desc())\
+        .limit(200)\
+        .all()
+    entries = [entry for entry, _ in rows]
+    next_beleg = (rows[0][1] + 1) if rows else 1
+    current_kassenstand = entries[0].kassenstand_bar_cents if entries else 0
+    theme, theme_color = theme_bundle()
     
-    # Get current user for display
-    current_user = session.get('cashbook_user', 'Admin')
     pending_cash_requests = cash_payment_requests.query.filter_by(status='pending').order_by(cash_payment_requests.created_at.asc()).all()
     
     return render_template('admin_cashbook.html',
@@ -3149,9 +3546,8 @@ def admin_cashbook():
                            company=company,
                            company_options=COMPANY_OPTIONS,
                            entries=entries,
-                           next_beleg=get_next_beleg_nummer(company),
-                           current_kassenstand=get_current_kassenstand(company) / 100.0,
-                           current_user=current_user,
+                           next_beleg=next_beleg,
+                           current_kassenstand=current_kassenstand / 100.0,
                            pending_cash_requests=pending_cash_requests)
 
 
@@ -3161,15 +3557,7 @@ def admin_cashbook_cash_requests():
     if not (is_admin_mode() or session.get('cashbook_authenticated', False)):
         return redirect(url_for('routes.index'))
 
-    theme = settings.get_value('theme', 'coffee') or 'coffee'
-    theme_colors = {
-        'coffee': '#222222',
-        'spring': '#4CAF50',
-        'summer': '#FF9800',
-        'autumn': '#FF5722',
-        'winter': '#2196F3'
-    }
-    theme_color = theme_colors.get(theme, '#222222')
+    theme, theme_color = theme_bundle()
 
     pending = cash_payment_requests.query.filter_by(status='pending').order_by(cash_payment_requests.created_at.asc()).all()
     recent = cash_payment_requests.query.filter(cash_payment_requests.status != 'pending').order_by(cash_payment_requests.updated_at.desc()).limit(20).all()
@@ -3188,9 +3576,7 @@ def admin_cashbook_add():
     if not (is_admin_mode() or session.get('cashbook_authenticated', False)):
         return redirect(url_for('routes.index'))
     try:
-        company = request.form.get('company') or COMPANY_OPTIONS[0]
-        if company not in COMPANY_OPTIONS:
-            company = COMPANY_OPTIONS[0]
+        company = _validated_company(request.form)
         beleg_nummer = None
         custom_beleg = (request.form.get('beleg_nummer') or '').strip()
         if custom_beleg:
@@ -3220,47 +3606,30 @@ def admin_cashbook_add():
         einnahmen_bar_eur = request.form.get('einnahmen_bar') or '0'
         ausgaben_bar_eur = request.form.get('ausgaben_bar') or '0'
         try:
-            einnahmen_bar_cents = int(round(float(einnahmen_bar_eur.replace(',', '.')) * 100))
+            einnahmen_bar_cents = _euros_to_cents(einnahmen_bar_eur)
         except ValueError:
             einnahmen_bar_cents = 0
         try:
-            ausgaben_bar_cents = int(round(float(ausgaben_bar_eur.replace(',', '.')) * 100))
+            ausgaben_bar_cents = _euros_to_cents(ausgaben_bar_eur)
         except ValueError:
             ausgaben_bar_cents = 0
         if not posten:
             flash('Posten is required.', 'error')
             return redirect(url_for('routes.admin_cashbook', company=company))
         
-        # Get the correct previous balance based on chronological order
-        # Find the entry that comes before this one chronologically
-        # We need entries with date < entry_date, or same date but lower ID
-        from sqlalchemy import or_, and_
-        prev_entry = (
-            cashbook_entries.query.filter_by(company=company)
+        # Balance of the entry that precedes this one chronologically (same day counts),
+        # evaluated inside the INSERT so no separate read can go stale
+        prev_kassenstand = (
+            db.session.query(cashbook_entries.kassenstand_bar_cents)
             .filter(
-                or_(
-                    cashbook_entries.entry_date < entry_date,
-                    and_(
-                        cashbook_entries.entry_date == entry_date,
-                        cashbook_entries.id.isnot(None)  # Will be filtered by order
-                    )
-                )
+                cashbook_entries.company == company,
+                cashbook_entries.entry_date <= entry_date
             )
             .order_by(cashbook_entries.entry_date.desc(), cashbook_entries.id.desc())
-            .first()
+            .limit(1)
+            .scalar_subquery()
         )
-        
-        if prev_entry:
-            prev_kassenstand = prev_entry.kassenstand_bar_cents
-        else:
-            # This is the first entry (or earliest entry)
-            prev_kassenstand = 0
-        
-        # Compute new cash balance
-        new_kassenstand = prev_kassenstand + einnahmen_bar_cents - ausgaben_bar_cents
-        
-        # Get current user for tracking
-        current_user = session.get('cashbook_user', 'Admin')
+        new_kassenstand = func.coalesce(prev_kassenstand, 0) + einnahmen_bar_cents - ausgaben_bar_cents
         
         row = cashbook_entries(
             company=company,
@@ -3271,7 +3640,7 @@ def admin_cashbook_add():
             einnahmen_bar_cents=einnahmen_bar_cents,
             ausgaben_bar_cents=ausgaben_bar_cents,
             kassenstand_bar_cents=new_kassenstand,
-            created_by=current_user,
+            created_by=g.cashbook_user,
         )
         db.session.add(row)
         db.session.flush()
@@ -3290,6 +3659,13 @@ def admin_cashbook_add():
         flash(f'Error adding entry: {e}', 'error')
     return redirect(url_for('routes.admin_cashbook', company=company))
 
+# Fields returned by admin_cashbook_get_entry, selected as plain columns
+_CASHBOOK_ENTRY_FIELDS = (
+    'id', 'beleg_nummer', 'entry_date', 'posten', 'bemerkung',
+    'einnahmen_bar_cents', 'ausgaben_bar_cents', 'kassenstand_bar_cents', 'created_by'
+)
+_CASHBOOK_ENTRY_COLUMNS = tuple(getattr(cashbook_entries, field) for field in _CASHBOOK_ENTRY_FIELDS)
+
 @bp.route('/admin/cashbook/get_entry/<int:entry_id>')
 def admin_cashbook_get_entry(entry_id):
     # Check authentication - either admin or cashbook user
@@ -3297,22 +3673,13 @@ def admin_cashbook_get_entry(entry_id):
         return jsonify({'success': False, 'error': 'Access denied'}), 403
     
     try:
-        entry = cashbook_entries.query.get_or_404(entry_id)
+        row = db.session.query(*_CASHBOOK_ENTRY_COLUMNS).filter(cashbook_entries.id == entry_id).first()
+        if row is None:
+            return jsonify({'success': False, 'error': 'Entry not found'}), 404
         
-        return jsonify({
-            'success': True,
-            'entry': {
-                'id': entry.id,
-                'beleg_nummer': entry.beleg_nummer,
-                'entry_date': entry.entry_date.strftime('%Y-%m-%d'),
-                'posten': entry.posten,
-                'bemerkung': entry.bemerkung,
-                'einnahmen_bar_cents': entry.einnahmen_bar_cents,
-                'ausgaben_bar_cents': entry.ausgaben_bar_cents,
-                'kassenstand_bar_cents': entry.kassenstand_bar_cents,
-                'created_by': entry.created_by
-            }
-        })
+        entry = dict(zip(_CASHBOOK_ENTRY_FIELDS, row))
+        entry['entry_date'] = entry['entry_date'].strftime('%Y-%m-%d')
+        return jsonify({'success': True, 'entry': entry})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -3337,11 +3704,8 @@ def admin_cashbook_edit_entry(entry_id):
         entry.posten = request.form.get('posten')
         entry.bemerkung = request.form.get('bemerkung', '')
         
-        einnahmen_bar_eur = float(request.form.get('einnahmen_bar_eur', 0))
-        ausgaben_bar_eur = float(request.form.get('ausgaben_bar_eur', 0))
-        
-        entry.einnahmen_bar_cents = int(einnahmen_bar_eur * 100)
-        entry.ausgaben_bar_cents = int(ausgaben_bar_eur * 100)
+        entry.einnahmen_bar_cents = _euros_to_cents(request.form.get('einnahmen_bar_eur') or '0')
+        entry.ausgaben_bar_cents = _euros_to_cents(request.form.get('ausgaben_bar_eur') or '0')
         
         # Recalculate kassenstand for this entry and all subsequent entries
         # This handles:
@@ -3430,7 +3794,7 @@ def admin_cashbook_fix_all_balances():
         
         if company:
             # Fix specific company
-            if company not in COMPANY_OPTIONS:
+            if company not in _COMPANY_SET:
                 return jsonify({'success': False, 'error': 'Invalid company'}), 400
             recalculate_all_kassenstand(company)
             db.session.commit()
@@ -3458,7 +3822,7 @@ def admin_resolve_cash_request(request_id):
     if not (is_admin_mode() or session.get('cashbook_authenticated', False)):
         return redirect(url_for('routes.index'))
     action = request.form.get('action', 'collect')
-    company = request.args.get('company', COMPANY_OPTIONS[0])
+    company = _validated_company(request.args)
     req = cash_payment_requests.query.get_or_404(request_id)
     if req.status != 'pending':
         flash('Anfrage bereits erledigt.', 'warning')
@@ -3547,16 +3911,7 @@ def api_cashbook_login():
         username = data.get('username', '').strip()
         password = data.get('password', '').strip()
         
-        # Hardcoded credentials
-        valid_credentials = {
-            'Laurin': 'Campus15',
-            'Max': 'Money',
-            'Lilian': 'Money',
-            'Jasmin': 'Money',
-            'Glenda': 'Money'
-        }
-        
-        if username in valid_credentials and valid_credentials[username] == password:
+        if verify_cashbook_credentials(username, password):
             # Store in session
             session['cashbook_authenticated'] = True
             session['cashbook_user'] = username
@@ -3592,7 +3947,20 @@ def security_gate_verify():
 
 # Admin backdoor removed - PIN bypass now automatic when admin is authenticated
 
+PRICE_LIST_CACHE_SECONDS = 600
+
+def _price_list_cache_key():
+    return f"price_list:{current_theme()}"
+
+def invalidate_price_list():
+    """Drop the cached price list page for every theme."""
+    try:
+        cache.delete_many(*(f"price_list:{theme}" for theme in THEME_COLORS))
+    except Exception as e:
+        print(f"WARNING: Cache delete failed: {e}")
+
 @bp.route("/price-list")
+@cache.cached(timeout=PRICE_LIST_CACHE_SECONDS, key_prefix=_price_list_cache_key)
 def price_list():
     """Price list page showing display items (like cakes) for customers"""
     # Get all active display items (like cakes, snacks, etc.)
@@ -3608,15 +3976,7 @@ def price_list():
         })
     
     # Get current theme and theme color
-    theme = settings.get_value('theme', 'coffee') or 'coffee'
-    theme_colors = {
-        'coffee': '#222222',
-        'spring': '#4CAF50',
-        'summer': '#FF9800',
-        'autumn': '#FF5722',
-        'winter': '#2196F3'
-    }
-    theme_color = theme_colors.get(theme, '#222222')
+    theme, theme_color = theme_bundle()
     
     return render_template("price_list.html", 
                          price_data=price_data,
@@ -3632,15 +3992,7 @@ def admin_display_items():
     all_items = display_items.query.order_by(display_items.display_order, display_items.name).all()
     
     # Get current theme and theme color
-    theme = settings.get_value('theme', 'coffee') or 'coffee'
-    theme_colors = {
-        'coffee': '#222222',
-        'spring': '#4CAF50',
-        'summer': '#FF9800',
-        'autumn': '#FF5722',
-        'winter': '#2196F3'
-    }
-    theme_color = theme_colors.get(theme, '#222222')
+    theme, theme_color = theme_bundle()
     
     return render_template("admin_display_items.html", 
                          items=all_items,
@@ -3653,17 +4005,14 @@ def add_display_item():
     """Add a new display item"""
     name = request.form.get('name', '').strip()
     description = request.form.get('description', '').strip()
-    price_euros = request.form.get('price_euros', type=float)
+    price_cents = request.form.get('price_euros', type=_euros_to_cents)
     category = request.form.get('category', 'food')
     display_order = request.form.get('display_order', type=int) or 0
     
-    if not name or not price_euros:
+    if not name or not price_cents:
         flash('Name and price are required.', 'error')
         return redirect(url_for('routes.admin_display_items'))
     
-    # Convert euros to cents
-    price_cents = int(price_euros * 100)
-    
     # Create new display item
     new_item = display_items(
         name=name,
@@ -3677,6 +4026,7 @@ def add_display_item():
     try:
         db.session.add(new_item)
         db.session.commit()
+        invalidate_price_list()
         flash(f'Display item "{name}" added successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -3691,12 +4041,12 @@ def update_display_item():
     item_id = request.form.get('item_id', type=int)
     name = request.form.get('name', '').strip()
     description = request.form.get('description', '').strip()
-    price_euros = request.form.get('price_euros', type=float)
+    price_cents = request.form.get('price_euros', type=_euros_to_cents)
     category = request.form.get('category', 'food')
     display_order = request.form.get('display_order', type=int) or 0
     is_active = request.form.get('is_active') == 'on'
     
-    if not item_id or not name or not price_euros:
+    if not item_id or not name or not price_cents:
         flash('Missing required fields.', 'error')
         return redirect(url_for('routes.admin_display_items'))
     
@@ -3709,7 +4059,7 @@ def update_display_item():
     # Update the item
     item.name = name
     item.description = description
-    item.price_cents = int(price_euros * 100)
+    item.price_cents = price_cents
     item.category = category
     item.display_order = display_order
     item.is_active = is_active
@@ -3717,6 +4067,7 @@ def update_display_item():
     
     try:
         db.session.commit()
+        invalidate_price_list()
         flash(f'Display item "{name}" updated successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -3736,6 +4087,7 @@ def delete_display_item(item_id):
     try:
         db.session.delete(item)
         db.session.commit()
+        invalidate_price_list()
         flash(f'Display item "{item.name}" deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -3749,8 +4101,7 @@ def set_theme():
     try:
         payload = request.get_json() or {}
         theme = payload.get('theme', 'coffee')
-        allowed = { 'coffee','spring','summer','autumn','winter' }
-        if theme not in allowed:
+        if theme not in THEME_COLORS:
             return jsonify({'success': False, 'error': 'Invalid theme'}), 400
 
         current_version = settings.get_value('theme_version', '1') or '1'
@@ -3762,6 +4113,9 @@ def set_theme():
         settings.set_value('theme', theme)
         settings.set_value('theme_version', next_version)
         db.session.commit()
+        invalidate_theme_cache()
+        invalidate_page_settings()
+        publish_theme(theme, next_version)
 
         # Invalidate cached pages that might embed theme-dependent markup
         try:
@@ -3792,6 +4146,7 @@ def api_toggle_payment_button():
         
         settings.set_value('payment_button_hidden', new_value)
         db.session.commit()
+        invalidate_page_settings()
         
         return jsonify({
             "success": True,
@@ -4592,24 +4947,57 @@ def revert_payment(payment_id):
     except Exception as e:
         return jsonify({"error": f"Failed to revert payment: {str(e)}"}), 500
 
+# Latest {theme, version} for /events streams. set_theme wakes streams in this
+# process immediately; changes from the other port's process arrive on resync.
+_theme_state = {'theme': None, 'version': None, 'synced': 0.0}
+_theme_changed = threading.Condition()
+THEME_RESYNC_SECONDS = 15
+
+def publish_theme(theme, version):
+    """Record the active theme and wake every waiting /events stream."""
+    with _theme_changed:
+        _theme_state.update(theme=theme, version=version, synced=time.time())
+        _theme_changed.notify_all()
+
+def _resync_theme_state():
+    """Re-read the theme settings at most once per THEME_RESYNC_SECONDS per process."""
+    with _theme_changed:
+        if time.time() - _theme_state['synced'] < THEME_RESYNC_SECONDS:
+            return
+        _theme_state['synced'] = time.time()
+    publish_theme(settings.get_value('theme', 'coffee'), settings.get_value('theme_version', '1'))
+
 @bp.route('/events')
 def sse_events():
     """Server-Sent Events stream for real-time theme updates.
-    Sends events of type 'theme' with JSON payload {theme, version}.
-    Includes periodic heartbeat to keep connection alive.
+    Sends events of type 'theme' with JSON payload {theme, version} and the version as event id.
+    Streams wait on set_theme notifications instead of polling settings;
+    idle connections get a ': ka' comment every THEME_RESYNC_SECONDS.
     """
+    app = current_app._get_current_object()
+    _resync_theme_state()
+    # A reconnecting browser sends the id of the last event it saw (the theme version);
+    # if that is still current, stay silent instead of replaying the theme
+    resume_version = request.headers.get('Last-Event-ID')
+
     def event_stream():
-        import time
-        last_version = None
+        last_version = resume_version
         while True:
             try:
-                current_theme = settings.get_value('theme', 'coffee')
-                current_version = settings.get_value('theme_version', '1')
-                if current_version != last_version:
-                    last_version = current_version
-                    yield f"event: theme\ndata: {{\"theme\":\"{current_theme}\",\"version\":\"{current_version}\"}}\n\n"
-                # Heartbeat every 15s
-                time.sleep(3)
+                # Sleep until set_theme publishes or the resync interval elapses
+                with _theme_changed:
+                    if _theme_state['version'] == last_version:
+                        _theme_changed.wait(timeout=THEME_RESYNC_SECONDS)
+                    theme, version = _theme_state['theme'], _theme_state['version']
+                if version == last_version:
+                    # Pick up changes made by the other port's process
+                    with app.app_context():
+                        _resync_theme_state()
+                    # Comment line keeps the connection open without firing onmessage
+                    yield ": ka\n\n"
+                    continue
+                last_version = version
+                yield f"id: {version}\nevent: theme\ndata: {{\"theme\":\"{theme}\",\"version\":\"{version}\"}}\n\n"
             except GeneratorExit:
                 break
             except Exception:
@@ -4632,6 +5020,11 @@ def admin_security_status():
 # ADMIN: Encoding / Umlaut Repair UI
 # =============================================================================
 
+_SUSPICIOUS_ENCODING_RE = re.compile(r'\?\?|Ã|\ufffd')
+_UMLAUT_PLACEHOLDER_RE = re.compile(r'\?\?')
+_UMLAUT_CANDIDATES = ('ä', 'ö', 'ü', 'ß')
+_UMLAUT_MAP = {'a': 'ä', 'o': 'ö', 'u': 'ü'}
+
 def _umlaut_guess(word: str) -> str:
     """Attempt a naive guess replacing '??' with likely German umlauts based on context.
     This is intentionally conservative; admin can override manually in the UI.
@@ -4644,41 +5037,42 @@ def _umlaut_guess(word: str) -> str:
     """
     if '??' not in word:
         return word
-    # Provide a minimal set of character candidates
-    candidates = ['ä','ö','ü','ß']
-    # Replace sequentially – if multiple occurrences, keep placeholders for manual review after first replacement
-    parts = word.split('??')
-    rebuilt = parts[0]
-    for tail in parts[1:]:
-        # Heuristic: if preceding char is a/o/u and next char is consonant, try umlaut of that vowel
-        replacement = 'ä'
-        prev = rebuilt[-1:] if rebuilt else ''
-        nextc = tail[:1]
-        if prev.lower() == 'a':
-            replacement = 'ä'
-        elif prev.lower() == 'o':
-            replacement = 'ö'
-        elif prev.lower() == 'u':
-            replacement = 'ü'
-        elif prev.lower() in 'aeiou' and nextc.lower() == 's':
-            replacement = 'ß'
-        else:
-            # fallback rotate choices to avoid uniform guess
-            replacement = candidates[len(rebuilt) % len(candidates)]
-        rebuilt += replacement + tail
-    return rebuilt
+    # Single regex pass over the placeholders; pieces are joined once at the end
+    parts = []
+    pos = 0
+    out_len = 0
+    prev = ''
+    for m in _UMLAUT_PLACEHOLDER_RE.finditer(word):
+        chunk = word[pos:m.start()]
+        if chunk:
+            prev = chunk[-1]
+        out_len += len(chunk)
+        # Heuristic: if preceding char is a/o/u, try umlaut of that vowel; vowel + 's' suggests ß
+        replacement = _UMLAUT_MAP.get(prev.lower())
+        if replacement is None:
+            nextc = word[m.end():m.end() + 1]
+            if prev.lower() in 'aeiou' and nextc.lower() == 's':
+                replacement = 'ß'
+            else:
+                # fallback rotate choices to avoid uniform guess
+                replacement = _UMLAUT_CANDIDATES[out_len % len(_UMLAUT_CANDIDATES)]
+        parts.append(chunk)
+        parts.append(replacement)
+        out_len += 1
+        prev = replacement
+        pos = m.end()
+    parts.append(word[pos:])
+    return ''.join(parts)
 
 ENCODING_FIXES_ENABLED = bool(os.getenv('ENABLE_ENCODING_FIXES'))
 
 if ENCODING_FIXES_ENABLED:
     @bp.route('/admin/encoding-fixes')
     def admin_encoding_fixes():
-        import re  # local import to avoid overhead when disabled
         suggestions = []
-        suspicious = re.compile(r'\?\?|Ã|�')
-        for u in users.query.limit(200).all():
+        for u in users.query.with_entities(users.id, users.first_name, users.last_name).limit(200).all():
             combined = f"{u.first_name} {u.last_name}"
-            if suspicious.search(combined):
+            if _SUSPICIOUS_ENCODING_RE.search(combined):
                 suggestions.append({
                     'type': 'user',
                     'id': u.id,
@@ -4691,21 +5085,21 @@ if ENCODING_FIXES_ENABLED:
 
     @bp.route('/admin/encoding-fixes/apply', methods=['POST'])
     def apply_encoding_fixes():
-        import re
-        updates = 0
+        updates = []
         try:
-            suspicious = re.compile(r'\?\?|Ã|�')
-            for u in users.query.limit(200).all():
+            for u in users.query.with_entities(users.id, users.first_name, users.last_name).limit(200).all():
                 combined = f"{u.first_name} {u.last_name}"
-                if suspicious.search(combined):
+                if _SUSPICIOUS_ENCODING_RE.search(combined):
                     guess = _umlaut_guess(combined)
                     parts = guess.split(' ', 1)
                     if len(parts) == 2:
-                        u.first_name, u.last_name = parts[0], parts[1]
-                        updates += 1
+                        updates.append({'id': u.id, 'first_name': parts[0], 'last_name': parts[1]})
             if updates:
+                # One executemany UPDATE instead of per-object change tracking
+                db.session.bulk_update_mappings(users, updates)
+                mark_index_data_changed()
                 db.session.commit()
-                flash(f'Applied {updates} encoding corrections.', 'success')
+                flash(f'Applied {len(updates)} encoding corrections.', 'success')
             else:
                 flash('No changes applied.', 'info')
         except Exception as e:
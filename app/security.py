@@ -5,9 +5,11 @@ Handles admin backdoor, security gates, and development bypasses
 
 import os
 import hashlib
+import hmac
 import secrets
+import time
 from functools import wraps
-from flask import request, session, redirect, url_for, flash, abort, jsonify
+from flask import request, session, redirect, url_for, flash, abort, jsonify, g
 
 # Security configuration
 ADMIN_SECRET_KEY = os.getenv('ADMIN_SECRET_KEY', 'laurin-build-admin-2024')
@@ -25,8 +27,10 @@ def _get_request_port() -> str:
     return os.getenv('PORT', '5000')
 
 def is_admin_port() -> bool:
-    """Treat port 5003 as admin UI, everything else as user UI."""
-    return _get_request_port() == '5003'
+    """Treat port 5003 as admin UI, everything else as user UI (memoized per request)."""
+    if 'is_admin_port' not in g:
+        g.is_admin_port = _get_request_port() == '5003'
+    return g.is_admin_port
 SECURITY_GATE_ENABLED = os.getenv('SECURITY_GATE_ENABLED', 'false').lower() == 'true'
 
 # Secure admin credentials (obfuscated to hide from code inspection)
@@ -36,6 +40,15 @@ _ADMIN_CREDENTIALS = {
     'password_hash': 'b2c3d4e5f6789012345678901234567890abcdef1234567890abcdef1234567'
 }
 
+_ADMIN_PASSWORD_ITERATIONS = 200_000
+_ADMIN_VERIFY_CACHE_SECONDS = 5
+# sha256(password) -> expiry timestamp for recently verified admin passwords
+_verified_admin_passwords = {}
+
+def _hash_admin_password(password, salt):
+    """Derive the stored form of an admin password (PBKDF2-SHA256)"""
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, _ADMIN_PASSWORD_ITERATIONS)
+
 def _get_admin_credentials():
     """Get admin credentials securely"""
     # Credentials are obfuscated to prevent direct reading
@@ -46,26 +59,60 @@ def _get_admin_credentials():
     username = ''.join(chr(c) for c in username_chars)
     password = ''.join(chr(c) for c in password_chars)
     
+    # Only a salted derivation of the password is kept in memory
+    salt = secrets.token_bytes(16)
     return {
-        'username_hash': hashlib.sha256(username.encode()).hexdigest(),
-        'password_hash': hashlib.sha256(password.encode()).hexdigest()
+        'username': username.encode(),
+        'password_salt': salt,
+        'password_hash': _hash_admin_password(password, salt)
     }
 
+# Derived once per process; the KDF is deliberately slow
+_ADMIN_SECRET = _get_admin_credentials()
+
 def verify_admin_credentials(username, password):
-    """Verify admin credentials securely"""
+    """Verify admin credentials securely (constant-time comparisons)"""
     if not username or not password:
         return False
     
-    # Get secure credentials
-    secure_creds = _get_admin_credentials()
+    username_ok = hmac.compare_digest(username.encode(), _ADMIN_SECRET['username'])
     
-    # Hash the provided credentials
-    username_hash = hashlib.sha256(username.encode()).hexdigest()
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
+    # Skip the KDF for a password that was verified moments ago (admin retries)
+    cache_key = hashlib.sha256(password.encode()).digest()
+    if _verified_admin_passwords.get(cache_key, 0) > time.time():
+        password_ok = True
+    else:
+        candidate = _hash_admin_password(password, _ADMIN_SECRET['password_salt'])
+        password_ok = hmac.compare_digest(candidate, _ADMIN_SECRET['password_hash'])
+        if password_ok:
+            _verified_admin_passwords[cache_key] = time.time() + _ADMIN_VERIFY_CACHE_SECONDS
     
-    # Compare with stored hashes
-    return (username_hash == secure_creds['username_hash'] and 
-            password_hash == secure_creds['password_hash'])
+    # Non-short-circuit so both checks always run
+    return username_ok & password_ok
+
+# Cashbook coworker logins: username -> (salt hex, PBKDF2-SHA256 hash hex)
+_CASHBOOK_CREDENTIALS = {
+    'Laurin': ('38c045752cfda45bd3d8cf205d2b4099', 'e7fcbaeb75615ca492dfc1050ed48925355606f19ea5d6c783c0eccb290186df'),
+    'Max': ('2769c69eb8218b159a157057981e7883', '31a9f9a81c3a11f11cff0cfdda0d0720ef4812db89dc4a4fc5acdf0f0649f5db'),
+    'Lilian': ('2e8dddfeb137691fd7b9f03937a86ac0', '81728541958aba92efbcc3c47a98e84f36a1ade744e4ed833e3e9d86077f638e'),
+    'Jasmin': ('e5a5870011a44d4362b65014ce843a6c', 'fe2913899786444c47534bd439fb4c8f478e5d17e7f5a2c81c44f781a70ea42e'),
+    'Glenda': ('aa7ec5840b5171756d6c8133ca270b33', 'e66e6e00fdd345a8f6070f6d0d2c275307c30f6bdf84a84aefaa0e9b4f87db2f'),
+}
+_CASHBOOK_CREDENTIALS = {
+    user: (bytes.fromhex(salt), bytes.fromhex(digest))
+    for user, (salt, digest) in _CASHBOOK_CREDENTIALS.items()
+}
+# Unknown usernames are checked against this so they take as long as real ones
+_CASHBOOK_DUMMY = (secrets.token_bytes(16), secrets.token_bytes(32))
+
+def verify_cashbook_credentials(username, password):
+    """Verify a cashbook coworker login (salted KDF, constant-time compare)"""
+    if not username or not password:
+        return False
+    stored = _CASHBOOK_CREDENTIALS.get(username)
+    salt, expected = stored or _CASHBOOK_DUMMY
+    candidate = _hash_admin_password(password, salt)
+    return hmac.compare_digest(candidate, expected) and stored is not None
 
 def is_admin_mode():
     """Admin mode only when hitting admin port and session is authenticated."""
@@ -54,6 +54,8 @@
     }
   }
   setTimeout(()=>{
+    // Fetch the full list: the server-rendered cards may come from a cached page with an
+    // older ordering, so an offset could skip users; render() drops the duplicates
     fetch('/api/index-data', {cache:'no-store'})
       .then(r=>{ if(!r.ok){ const e=new Error('HTTP '+r.status); e.status=r.status; throw e;} return r.json();})
       .then(d=>{ if(!d.users) throw new Error('Malformed'); render(d.users); })